@@ -2,12 +2,19 @@ import streamlit as st
 import pandas as pd
 import sys
 import os
+import time
 import plotly.express as px # Import plotly for plotting
-from collections import defaultdict # To easily count terms
 
 # Import actual gene search function
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from utils.helpers import search_gene_function
+from utils.helpers import load_sections, search_gene_function
+from utils import config, metrics
+from utils.fetch import FetchError
+from utils.resolve import resolve_identifiers
+from utils.jobs import content_hash, get_or_start_job
+from utils.ingest import SUPPORTED_EXTENSIONS, file_extension, iter_genes, read_columns, read_preview
+from utils.models import records_to_frames
+from utils.aggregate import get_aggregates, top_terms_for_category
 
 # Configure page settings for wide layout and collapsed sidebar
 st.set_page_config(page_title="Gene2Function", layout="wide", initial_sidebar_state="collapsed")
@@ -17,102 +24,210 @@ st.subheader("🔍 Enter a Gene or Upload a File")
 # Initialize session state for storing results (only needed for passing to another page)
 if 'gene_search_results' not in st.session_state:
     st.session_state['gene_search_results'] = []
-if 'original_pathways' not in st.session_state:
-    st.session_state['original_pathways'] = None
-if 'original_go_terms' not in st.session_state:
-    st.session_state['original_go_terms'] = None
+if 'go_table' not in st.session_state:
+    st.session_state['go_table'] = None
+if 'pathway_table' not in st.session_state:
+    st.session_state['pathway_table'] = None
+
+if config.BACKEND == "local":
+    st.caption(f"📦 Annotating from the local index at {config.LOCAL_INDEX_PATH}")
 
 gene_input = st.text_input("🔡 Enter Gene Symbol/ID:")
 uploaded_file = st.file_uploader("📁 Or Upload a CSV/TSV/Excel File", type=["csv", "tsv", "xlsx"])
 
+# -----------------------
+# Cached lookups (widget changes rerun this script; these keep reruns off the network)
+# -----------------------
+@st.cache_data(show_spinner=False)
+def lookup_single_gene(gene):
+    return search_gene_function(gene)
+
+@st.cache_data(show_spinner=False)
+def upload_columns(file_bytes, ext):
+    return read_columns(file_bytes, ext)
+
+@st.cache_data(show_spinner=False)
+def upload_preview(file_bytes, ext, column):
+    return read_preview(file_bytes, ext, column)
+
+def format_eta(seconds):
+    if seconds is None:
+        return "estimating..."
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes}m {secs:02d}s" if minutes else f"{secs}s"
+
 # -----------------------
 # File or manual input
 # -----------------------
 search_performed = False
+job_running = False # True while an upload is still being annotated in the background
 current_results = [] # Temporary list for current search
+show_plots = False
 
 if gene_input:
     with st.spinner("🔎 Searching..."):
-        result = search_gene_function(gene_input.strip())
+        try:
+            result = lookup_single_gene(gene_input.strip())
+        except FetchError as e:
+            st.error(f"❌ Could not reach mygene.info, please try again: {e}")
+            st.stop()
+        except FileNotFoundError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+        if not result:
+            resolution = resolve_identifiers([gene_input.strip()])[0]
+            if resolution["status"] == "ambiguous":
+                st.warning(f"⚠️ '{gene_input.strip()}' is an alias of several genes: {', '.join(resolution['candidates'])}. Please enter one of them.")
+    # As for uploads, the session results are rebuilt only for a new search: the stored record
+    # keeps any GO/pathway sections loaded into it since, so widget changes reload nothing
+    results_version = ("single", gene_input.strip())
+    if st.session_state.get('results_version') != results_version:
         if result:
-            result["input_gene"] = gene_input.strip()
             current_results.append(result)
-    search_performed = True
+        st.session_state['results_version'] = results_version
+        search_performed = True
 
 elif uploaded_file:
-    ext = uploaded_file.name.split('.')[-1]
-    if ext == "csv":
-        df = pd.read_csv(uploaded_file)
-    elif ext == "tsv":
-        df = pd.read_csv(uploaded_file, sep="\t")
-    elif ext == "xlsx":
-        df = pd.read_excel(uploaded_file)
-    else:
+    ext = file_extension(uploaded_file.name)
+    if ext not in SUPPORTED_EXTENSIONS:
         st.error("❌ Unsupported file format.")
         st.stop()
 
-    gene_column = df.columns[0]
-    genes = df[gene_column].dropna().astype(str).unique()
+    file_bytes = uploaded_file.getvalue()
+    columns = upload_columns(file_bytes, ext)
+    gene_column = st.selectbox("🧬 Column containing gene symbols/IDs", columns, index=0, key="upload_gene_column")
 
     st.write("📋 Preview of uploaded gene list:")
-    st.dataframe(df[[gene_column]].head(10))
-
-    with st.spinner(f"🔍 Searching {len(genes)} gene(s)..."):
-        for gene in genes:
-            res = search_gene_function(gene.strip())
-            if res:
-                res["input_gene"] = gene.strip()
-                current_results.append(res)
-    search_performed = True
+    st.dataframe(upload_preview(file_bytes, ext, gene_column))
+
+    # Annotation runs as a background job keyed by the file's content hash and chosen column.
+    # The file is streamed in chunks into the lookup stage, the job checkpoints as it goes,
+    # and reruns and page refreshes just reattach to it
+    job_id = content_hash(file_bytes + b"\0" + gene_column.encode("utf-8"))
+    job = get_or_start_job(job_id, lambda: iter_genes(file_bytes, ext, gene_column))
+    progress = job.progress()
+
+    if progress["status"] == "running":
+        job_running = True
+        if progress["loading"]:
+            progress_text = f"📥 Reading file... annotated {progress['done']} of {progress['total']} gene(s) so far"
+        else:
+            progress_text = f"🔍 Annotated {progress['done']}/{progress['total']} gene(s) — ETA {format_eta(progress['eta_seconds'])}"
+        st.progress(progress["fraction"], text=progress_text)
+    elif progress["status"] == "failed":
+        st.error(f"❌ Annotation stopped after {progress['done']}/{progress['total']} gene(s): {progress['error']}")
+        if st.button("🔁 Resume annotation"):
+            job.start()
+            st.rerun()
+        st.stop()
+    elif progress["failed"]:
+        # Transient failures (timeouts, rate limits) are worth another try once the job is done
+        if st.button(f"🔁 Retry {progress['failed']} failed gene(s)", key="retry_failed_genes"):
+            job.start()
+            st.rerun()
+
+    batch_results = job.results()
+
+    # Only rebuild the session results when new (partial) results have arrived, not on every widget change
+    results_version = (job_id, progress["version"])
+    if st.session_state.get('results_version') != results_version:
+        for entry in batch_results:
+            if entry["result"]:
+                current_results.append(entry["result"])
+        st.session_state['results_version'] = results_version
+        search_performed = True
+
+    # Report inputs that did not resolve cleanly to a single gene
+    not_found = [e["input_gene"] for e in batch_results if e["status"] == "notfound"]
+    duplicates = [e["input_gene"] for e in batch_results if e["status"] == "duplicate"]
+    ambiguous = [f"{e['input_gene']} ({'/'.join(e['candidates'])})" for e in batch_results if e["status"] == "ambiguous"]
+    failed = [e["input_gene"] for e in batch_results if e["status"] in ("error", "uncached")]
+    if not_found:
+        st.warning(f"⚠️ {len(not_found)} gene(s) not found: {', '.join(not_found[:20])}{' ...' if len(not_found) > 20 else ''}")
+    if duplicates:
+        st.info(f"ℹ️ {len(duplicates)} gene(s) matched multiple records; the best match was used: {', '.join(duplicates[:20])}{' ...' if len(duplicates) > 20 else ''}")
+    if ambiguous:
+        st.warning(f"⚠️ {len(ambiguous)} input(s) are aliases of several genes and were not looked up: {', '.join(ambiguous[:20])}{' ...' if len(ambiguous) > 20 else ''}")
+    if failed:
+        st.error(f"❌ {len(failed)} gene(s) could not be fetched: {', '.join(failed[:20])}{' ...' if len(failed) > 20 else ''}")
 
 # Store results in session state ONLY after a search is performed
 # These will be used by the '1_Gene_Table.py' page
+# Results are kept as long-form tables: one row per gene, per gene x GO term and per gene x pathway
 if search_performed:
     st.session_state['gene_search_results'] = current_results
     if current_results:
-        temp_df = pd.DataFrame(current_results)
-        if "pathway" in temp_df.columns:
-            st.session_state['original_pathways'] = temp_df["pathway"].copy()
-        if "go_terms" in temp_df.columns:
-            st.session_state['original_go_terms'] = temp_df["go_terms"].copy()
+        gene_table, go_table, pathway_table = records_to_frames(current_results)
+        st.session_state['gene_table'] = gene_table
+        st.session_state['go_table'] = go_table
+        st.session_state['pathway_table'] = pathway_table
     else:
-        st.session_state['original_pathways'] = None
-        st.session_state['original_go_terms'] = None
+        st.session_state['gene_table'] = None
+        st.session_state['go_table'] = None
+        st.session_state['pathway_table'] = None
 
 # -----------------------
 # Display Plots on the same page
 # -----------------------
 if st.session_state['gene_search_results']: # Check if there are results to display plots
-    st.success(f"✅ Search complete! Found {len(st.session_state['gene_search_results'])} gene(s).")
+    if job_running:
+        st.info(f"⏳ Showing partial results: {len(st.session_state['gene_search_results'])} gene(s) found so far.")
+    else:
+        st.success(f"✅ Search complete! Found {len(st.session_state['gene_search_results'])} gene(s).")
     st.markdown("---")
 
     # Display button to navigate to the Gene Table page
     st.info("Click the button below to view the full Gene Function Table on a separate page.")
     
     # Give the function to the View Gene Table button to switch page
-    if st.button("➡️ View Gene Table"):
-        st.switch_page("pages/1_Gene_Table.py") # Explicitly switch to the Gene Table page
+    col_nav_table, col_nav_enrichment = st.columns(2)
+    with col_nav_table:
+        if st.button("➡️ View Gene Table"):
+            st.switch_page("pages/1_Gene_Table.py") # Explicitly switch to the Gene Table page
+    with col_nav_enrichment:
+        if st.button("🧪 Run Enrichment Analysis"):
+            st.switch_page("pages/2_Enrichment.py")
 
 
     st.markdown("### 📈 Data Visualizations")
 
+    # With a light field profile (G2F_FIELD_PROFILE) the large GO/pathway sections are left
+    # out of the initial lookup and fetched, in one batch, only when the plots are opened.
+    # Once loaded they stay in the session results, so the plots then show straight away.
+    records = st.session_state['gene_search_results']
+    show_plots = all(r.is_complete() for r in records)
+    if not show_plots and st.toggle("📥 Load GO terms and pathways to show the plots", key="load_plot_sections"):
+        if job_running:
+            # Not on every progress poll: one batch once the job is done
+            st.caption("⏳ GO terms and pathways will be loaded once annotation finishes.")
+        else:
+            with st.spinner("📥 Loading GO terms and pathways..."):
+                load_sections(records)
+            _, st.session_state['go_table'], st.session_state['pathway_table'] = records_to_frames(records)
+            if not all(r.is_complete() for r in records):
+                st.warning("⚠️ GO terms and pathways could not be loaded for some genes; they are retried on the next refresh.")
+            show_plots = True
+
+# The plots need the GO/pathway sections (see the toggle above)
+if st.session_state['gene_search_results'] and show_plots:
+    records = st.session_state['gene_search_results']
     # Use the results directly from session_state for plotting
-    current_results_df = pd.DataFrame(st.session_state['gene_search_results'])
-    original_pathways_for_plot = st.session_state['original_pathways']
-    original_go_terms_for_plot = st.session_state['original_go_terms']
+    go_table = st.session_state['go_table']
+    pathway_table = st.session_state['pathway_table']
+
+    # Counts are memoized on the result set, so widget changes below only rebuild the figures
+    plots_started = time.perf_counter()
+    max_items_to_show = 10
+    # Keyed on the job and its results version rather than a hash of every row; the count of
+    # complete records changes when GO/pathway sections are loaded into the same results
+    results_version = st.session_state.get('results_version')
+    aggregates_version = (results_version, sum(r.is_complete() for r in records)) if results_version else None
+    aggregates = get_aggregates(go_table, pathway_table, top_n=max_items_to_show, version=aggregates_version)
 
     # --- Plot 1: Detailed Gene Ontology (GO) Term Analysis (Three Pie Charts) ---
-    if original_go_terms_for_plot is not None and not original_go_terms_for_plot.isnull().all().all():
+    if go_table is not None and not go_table.empty:
         st.markdown("#### Gene Ontology (GO) Term Analysis")
 
-        go_terms_by_category = defaultdict(list)
-        for entry in original_go_terms_for_plot.dropna():
-            for term_entry in entry.split(';'):
-                term_entry = term_entry.strip()
-                if ':' in term_entry:
-                    category, term_name = term_entry.split(':', 1)
-                    go_terms_by_category[category.strip()].append(term_name.strip())
-        
         go_categories_order = ["Biological Process", "Cellular Component", "Molecular Function"]
 
         for category in go_categories_order: # Iterate through categories for vertical display
@@ -136,11 +251,8 @@ if st.session_state['gene_search_results']: # Check if there are results to disp
             st.markdown("---") # Separator
 
 
-            if category in go_terms_by_category and go_terms_by_category[category]:
-                term_counts = pd.Series(go_terms_by_category[category]).value_counts().reset_index()
-                term_counts.columns = ['Term', 'Count']
-                max_terms_to_show = 10
-                plot_df = term_counts.head(max_terms_to_show)
+            plot_df = top_terms_for_category(aggregates, category)
+            if not plot_df.empty:
 
                 fig_go_pie = px.pie(plot_df, values='Count', names='Term',
                                     title=f'Distribution of {category} Terms',
@@ -164,7 +276,7 @@ if st.session_state['gene_search_results']: # Check if there are results to disp
 
 
     # --- Plot 2: Pathway Database Distribution ---
-    if original_pathways_for_plot is not None and not original_pathways_for_plot.isnull().all().all():
+    if pathway_table is not None and not pathway_table.empty:
         st.subheader("Distribution of Genes Across Pathway Databases")
 
         # --- Per-Plot Customization Options for Pathway Distribution ---
@@ -185,17 +297,9 @@ if st.session_state['gene_search_results']: # Check if there are results to disp
         st.markdown("---") # Separator
 
 
-        pathway_db_counts = {}
-        for entry in original_pathways_for_plot.dropna():
-            for pathway_id_name in entry.split(';'):
-                if ':' in pathway_id_name:
-                    db_name = pathway_id_name.split(':')[0].strip()
-                    pathway_db_counts[db_name] = pathway_db_counts.get(db_name, 0) + 1
+        plot_df_pathways = aggregates["pathway_dbs"]
 
-        if pathway_db_counts:
-            pathway_plot_df = pd.DataFrame(pathway_db_counts.items(), columns=["Pathway Database", "Number of Genes"])
-            max_pathways_to_show = 10
-            plot_df_pathways = pathway_plot_df.sort_values(by='Number of Genes', ascending=False).head(max_pathways_to_show)
+        if not plot_df_pathways.empty:
 
             fig_pathway = px.pie(plot_df_pathways, values="Number of Genes", names="Pathway Database",
                                  title="Proportion of Genes per Pathway Database",
@@ -213,6 +317,24 @@ if st.session_state['gene_search_results']: # Check if there are results to disp
             st.plotly_chart(fig_pathway, use_container_width=True) # Ensure it takes available width
         else:
             st.info("No detailed pathway database information found for plotting.")
-elif search_performed and not st.session_state['gene_search_results']:
+    metrics.record_stage("plots", time.perf_counter() - plots_started)
+elif search_performed and not job_running and not st.session_state['gene_search_results']:
     st.warning("No results found for the provided gene(s). Please try a different input.")
 
+# -----------------------
+# Performance diagnostics (enabled with G2F_METRICS=1)
+# -----------------------
+if metrics.enabled():
+    with st.expander("🩺 Performance diagnostics"):
+        hit_ratio = metrics.cache_hit_ratio()
+        st.caption(f"Cache hit ratio: {hit_ratio:.1%}" if hit_ratio is not None else "Cache hit ratio: no lookups yet")
+        for title, table in metrics.summary_tables().items():
+            st.markdown(f"**{title}**")
+            st.dataframe(table, hide_index=True, use_container_width=True)
+        st.download_button("⬇️ Download metrics (Prometheus format)", metrics.to_prometheus(),
+                           file_name="gene2function_metrics.prom", mime="text/plain")
+
+# Poll the background job: partial results above are refreshed until it finishes
+if job_running:
+    time.sleep(1)
+    st.rerun()
@@ -1,61 +1,114 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from utils import metrics
+from utils.export import EXPORT_KINDS, cached_export_path, export_key, export_results
+from utils.helpers import load_sections
+from utils.models import records_to_frames
 
 st.set_page_config(page_title="Gene Function Table", layout="wide", initial_sidebar_state="collapsed")
 
+COLUMNS_ORDER = [
+    "input_gene", "gene_symbol", "name", "function",
+    "pathway", "go_terms", "pharmgkb", "entrez_id", "uniprot", "taxid"
+]
+PAGE_SIZE_OPTIONS = [25, 50, 100, 250]
+CSV_PREVIEW_ROWS = 20
+
 # -----------------------
 # Helper: pathway links
 # -----------------------
-def make_pathway_links(pathways, for_display_html=True):
-    links = []
-    if pd.isna(pathways) or pathways == "":
-        return ""
-
-    for entry in str(pathways).split(';'):
-        entry = entry.strip()
-        if not entry:
-            continue
-
-        if ':' in entry:
-            source, pid = entry.split(':', 1)
-            source = source.strip().lower()
-            pid = pid.strip()
-
-            if for_display_html:
-                if source == "kegg":
-                    links.append(f'<a href="https://www.kegg.jp/dbget-bin/www_bget?{pid}" target="_blank">{pid}</a>')
-                elif source == "reactome":
-                    links.append(f'<a href="https://reactome.org/PathwayBrowser/#/{pid}" target="_blank">{pid}</a>')
-                elif source == "wikipathways":
-                    links.append(f'<a href="https://www.wikipathways.org/instance/{pid}" target="_blank">{pid}</a>')
-                elif source == "netpath":
-                    links.append(f'<a href="https://www.netpath.org/pathways?path_id={pid}" target="_blank">{pid}</a>')
-                elif source == "biocarta":
-                    links.append(f'<a href="https://cgap.nci.nih.gov/Pathways/BioCarta_Pathways?ID={pid}" target="_blank">{pid}</a>')
-                elif source == "pid":
-                    links.append(f'<a href="https://www.ndexbio.org/viewer/networks/{pid}" target="_blank">{pid}</a>')
-                elif source == "smpdb":
-                    links.append(f'<a href="https://smpdb.ca/pathways/{pid}" target="_blank">{pid}</a>')
-                else:
-                    links.append(pid)
-            else:
-                links.append(pid)
-        else:
-            links.append(entry)
-
-    return ", ".join(links)
+# Link templates per pathway database; databases without one are shown as plain IDs
+PATHWAY_URL_TEMPLATES = {
+    "kegg": "https://www.kegg.jp/dbget-bin/www_bget?{pid}",
+    "reactome": "https://reactome.org/PathwayBrowser/#/{pid}",
+    "wikipathways": "https://www.wikipathways.org/instance/{pid}",
+    "netpath": "https://www.netpath.org/pathways?path_id={pid}",
+    "biocarta": "https://cgap.nci.nih.gov/Pathways/BioCarta_Pathways?ID={pid}",
+    "pid": "https://www.ndexbio.org/viewer/networks/{pid}",
+    "smpdb": "https://smpdb.ca/pathways/{pid}",
+}
+
+def make_pathway_links(pathway_table, for_display_html=True):
+    # One comma-separated pathway string per input gene, built from the gene x pathway table
+    if pathway_table is None or pathway_table.empty:
+        return pd.Series(dtype=object)
+
+    pids = pathway_table["pathway_id"].astype(str)
+    if for_display_html:
+        templates = pathway_table["db"].astype(str).str.lower().map(PATHWAY_URL_TEMPLATES)
+        links = pids.astype(object)
+        has_link = templates.notna()
+        links[has_link] = [
+            f'<a href="{template.format(pid=pid)}" target="_blank">{pid}</a>'
+            for template, pid in zip(templates[has_link], pids[has_link])
+        ]
+    else:
+        links = pids
+
+    return links.groupby(pathway_table["input_gene"], sort=False).agg(", ".join)
+
+def make_go_terms(go_table):
+    # One "Category:Term; ..." string per input gene, built from the gene x GO table
+    if go_table is None or go_table.empty:
+        return pd.Series(dtype=object)
+    labels = go_table["category"].astype(str) + ":" + go_table["term"].astype(str)
+    return labels.groupby(go_table["input_gene"], sort=False).agg("; ".join)
+
+# -----------------------
+# Helper: paged display
+# -----------------------
+def page_display_frames(page_genes, go_table, pathway_table):
+    # Build the HTML and plain display frames for one page of genes only, so link HTML
+    # and joined GO/pathway strings never get built for rows that are not shown
+    page_ids = page_genes["input_gene"]
+    page_go = go_table[go_table["input_gene"].isin(page_ids)] if go_table is not None else None
+    page_pathways = pathway_table[pathway_table["input_gene"].isin(page_ids)] if pathway_table is not None else None
+
+    result_df = page_genes.copy()
+    result_df["go_terms"] = page_ids.map(make_go_terms(page_go)).fillna("Not available")
+
+    # DataFrame for HTML clickable view
+    html_df = result_df.copy()
+    html_df["pathway"] = page_ids.map(make_pathway_links(page_pathways, for_display_html=True)).fillna("Not available")
+
+    # DataFrame for interactive Streamlit table (no HTML)
+    clean_df = result_df.copy()
+    clean_df["pathway"] = page_ids.map(make_pathway_links(page_pathways, for_display_html=False)).fillna("Not available")
+
+    html_df = html_df[[col for col in COLUMNS_ORDER if col in html_df.columns]]
+    clean_df = clean_df[[col for col in COLUMNS_ORDER if col in clean_df.columns]]
+    return html_df, clean_df
+
+def highlight_missing(df):
+    # Whole-frame style mask in one vectorized step instead of a Python call per cell
+    missing = df.isna() | (df.astype(str) == "")
+    return pd.DataFrame(np.where(missing, 'background-color: #ffdddd', ''), index=df.index, columns=df.columns)
 
 # -----------------------
 # Get session state results
 # -----------------------
-results = st.session_state.get('gene_search_results', [])
+# The table shows GO terms and pathways; with a light field profile they are fetched now, in one batch
+records = st.session_state.get('gene_search_results') or []
+if not all(r.is_complete() for r in records):
+    with st.spinner("📥 Loading GO terms and pathways..."):
+        load_sections(records)
+    _, st.session_state['go_table'], st.session_state['pathway_table'] = records_to_frames(records)
+    if not all(r.is_complete() for r in records):
+        st.warning("⚠️ GO terms and pathways could not be loaded for some genes; they are retried on the next refresh.")
+
+gene_table = st.session_state.get('gene_table')
+go_table = st.session_state.get('go_table')
+pathway_table = st.session_state.get('pathway_table')
 
 # -----------------------
 # Display Results
 # -----------------------
-if results:
-    result_df = pd.DataFrame(results)
-
+if gene_table is not None and not gene_table.empty:
     # Add anchor at the top
     st.markdown('<a name="top"></a>', unsafe_allow_html=True)
 
@@ -64,46 +117,75 @@ if results:
 
     st.header("Gene Function Table")
 
-    # DataFrame for HTML clickable view
-    html_df = result_df.copy()
-    if "pathway" in html_df.columns:
-        html_df["pathway"] = html_df["pathway"].apply(lambda x: make_pathway_links(x, for_display_html=True))
-
-    # DataFrame for interactive Streamlit table (no HTML)
-    clean_df = result_df.copy()
-    if "pathway" in clean_df.columns:
-        clean_df["pathway"] = clean_df["pathway"].apply(lambda x: make_pathway_links(x, for_display_html=False))
-
-    columns_order = [
-        "input_gene", "gene_symbol", "name", "function",
-        "pathway", "go_terms", "pharmgkb", "entrez_id", "uniprot", "taxid"
-    ]
-    html_df = html_df[[col for col in columns_order if col in html_df.columns]]
-    clean_df = clean_df[[col for col in columns_order if col in clean_df.columns]]
+    # --- Server-side sorting and pagination: only one page is ever rendered ---
+    sortable_columns = [col for col in COLUMNS_ORDER if col in gene_table.columns]
+    col_sort, col_order, col_size, col_page = st.columns(4)
+    with col_sort:
+        sort_column = st.selectbox("Sort by", sortable_columns, index=0, key="table_sort_column")
+    with col_order:
+        sort_ascending = st.radio("Order", ["Ascending", "Descending"], horizontal=True, key="table_sort_order") == "Ascending"
+    with col_size:
+        page_size = st.selectbox("Rows per page", PAGE_SIZE_OPTIONS, index=1, key="table_page_size")
+    total_rows = len(gene_table)
+    total_pages = max(1, -(-total_rows // page_size))
+    with col_page:
+        page_number = st.number_input(f"Page (of {total_pages})", min_value=1, max_value=total_pages, value=1, step=1, key="table_page_number")
+
+    # Sort the compact gene table, then slice the page before any display strings are built
+    sorted_genes = gene_table.sort_values(
+        sort_column, ascending=sort_ascending, kind="stable", na_position="last",
+        key=lambda col: col.str.lower() if pd.api.types.is_string_dtype(col) else col)
+    page_start = (int(page_number) - 1) * page_size
+    page_genes = sorted_genes.iloc[page_start:page_start + page_size]
+
+    with metrics.timer("table_page_frames"):
+        html_df, clean_df = page_display_frames(page_genes, go_table, pathway_table)
+    st.caption(f"Showing rows {page_start + 1}–{page_start + len(page_genes)} of {total_rows}")
 
     # Display HTML table with links
     st.markdown("### 📊 Gene Function Table (with Clickable Pathways)")
-    st.markdown(html_df.to_html(escape=False, index=False), unsafe_allow_html=True)
+    with metrics.timer("table_html"):
+        table_html = html_df.to_html(escape=False, index=False)
+    st.markdown(table_html, unsafe_allow_html=True)
 
     # Display Streamlit interactive table
     st.markdown("### 🔍 Interactive Table (Filterable, Non-clickable)")
-    def highlight_missing(s):
-        return ['background-color: #ffdddd' if pd.isna(v) or v == "" else '' for v in s]
-
-    st.dataframe(clean_df.style.apply(highlight_missing, axis=0), use_container_width=True)
-
-    # CSV Preview
-    st.markdown("📝 **Preview CSV Content (copyable)**")
-    st.code(clean_df.drop(columns=["pathway"]).to_csv(index=False), language='csv')
-
-    # Download CSV
-    csv = clean_df.drop(columns=["pathway"]).to_csv(index=False).encode("utf-8")
-    st.download_button(
-        label="⬇️ Download Results as CSV",
-        data=csv,
-        file_name="gene2function_results.csv",
-        mime="text/csv"
-    )
+    st.dataframe(clean_df.style.apply(highlight_missing, axis=None), use_container_width=True)
+
+    # CSV Preview (first rows only; the download below has everything)
+    st.markdown(f"📝 **Preview CSV Content (first {min(CSV_PREVIEW_ROWS, len(clean_df))} rows of this page, copyable)**")
+    st.code(clean_df.head(CSV_PREVIEW_ROWS).to_csv(index=False), language='csv')
+
+    # Downloads: each export is streamed to disk once per result set and then reused
+    st.markdown("### ⬇️ Download Results")
+    # Hashing large tables takes a moment, so the key is kept while the same tables are in the session
+    tables = (gene_table, go_table, pathway_table)
+    cached_key = st.session_state.get('export_key')
+    if cached_key is None or any(a is not b for a, b in zip(cached_key[0], tables)):
+        cached_key = (tables, export_key(*tables))
+        st.session_state['export_key'] = cached_key
+    result_key = cached_key[1]
+    col_format, col_download = st.columns([2, 1])
+    with col_format:
+        export_kind = st.selectbox("Format", list(EXPORT_KINDS), format_func=lambda kind: EXPORT_KINDS[kind]["label"], key="export_kind")
+    export_path = cached_export_path(gene_table, go_table, pathway_table, export_kind, key=result_key)
+    with col_download:
+        if export_path is None and st.button("📦 Prepare download", key="prepare_export"):
+            with st.spinner("Writing export..."):
+                export_path = export_results(gene_table, go_table, pathway_table, export_kind, key=result_key)
+        if export_path is not None:
+            try:
+                with open(export_path, "rb") as f:
+                    st.download_button(
+                        label="⬇️ Download",
+                        data=f,
+                        file_name=f"gene2function_results.{EXPORT_KINDS[export_kind]['suffix']}",
+                        mime=EXPORT_KINDS[export_kind]["mime"],
+                        key="download_export"
+                    )
+            except FileNotFoundError:
+                # Evicted since it was found; it is written again on the next request
+                st.info("ℹ️ This export was cleaned up in the meantime; please prepare it again.")
 
     # Anchor at bottom
     st.markdown('<a name="bottom"></a>', unsafe_allow_html=True)
@@ -0,0 +1,147 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import sys
+import os
+import io
+import plotly.express as px
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from utils import config
+from utils.helpers import load_sections
+from utils.models import records_to_frames
+from utils.enrichment import IncidenceMatrix, annotation_terms, enrich, local_index_terms
+
+st.set_page_config(page_title="Enrichment Analysis", layout="wide", initial_sidebar_state="collapsed")
+
+BACKGROUND_RESULTS = "Current results (test a subset against all annotated genes)"
+BACKGROUND_INDEX = "Local annotation index (whole genome)"
+BACKGROUND_FILE = "Annotation tables from the command line (.go / .pathways Parquet)"
+
+# -----------------------
+# Cached background matrices (built once per background, reused for every query)
+# -----------------------
+@st.cache_resource(show_spinner="Building background from the local index...")
+def index_background(index_path, mtime):
+    return IncidenceMatrix(local_index_terms(index_path))
+
+@st.cache_resource(show_spinner="Building background from uploaded tables...")
+def file_background(go_bytes, pathway_bytes):
+    go = pd.read_parquet(io.BytesIO(go_bytes)) if go_bytes else None
+    pathways = pd.read_parquet(io.BytesIO(pathway_bytes)) if pathway_bytes else None
+    return IncidenceMatrix(annotation_terms(go, pathways))
+
+@st.cache_data(show_spinner=False)
+def results_terms(go_table, pathway_table):
+    return annotation_terms(go_table, pathway_table)
+
+# -----------------------
+# Get session state results
+# -----------------------
+gene_table = st.session_state.get('gene_table')
+go_table = st.session_state.get('go_table')
+pathway_table = st.session_state.get('pathway_table')
+
+st.header("🧪 GO & Pathway Enrichment")
+
+if gene_table is None or gene_table.empty:
+    st.info("No gene search results available. Please go back to the home page and search for genes.")
+    st.stop()
+
+# -----------------------
+# Query and background
+# -----------------------
+result_genes = gene_table["gene_symbol"].dropna().astype(str).unique().tolist()
+subset_text = st.text_area("🔡 Query genes (one per line; leave empty to use all genes in the current results)", height=120)
+query_genes = [g.strip() for g in subset_text.splitlines() if g.strip()] or result_genes
+
+background_options = [BACKGROUND_RESULTS]
+if os.path.exists(config.LOCAL_INDEX_PATH):
+    background_options.append(BACKGROUND_INDEX)
+background_options.append(BACKGROUND_FILE)
+background_choice = st.radio("Background gene set", background_options,
+                             index=background_options.index(BACKGROUND_INDEX) if BACKGROUND_INDEX in background_options else 0)
+
+incidence = None
+if background_choice == BACKGROUND_RESULTS:
+    if not subset_text.strip():
+        st.warning("⚠️ With the current results as background, enter a subset of genes to test; the full result set cannot be enriched against itself.")
+        st.stop()
+    # With a light field profile the GO/pathway sections are fetched on first use, in one batch
+    records = st.session_state.get('gene_search_results') or []
+    if not all(r.is_complete() for r in records):
+        with st.spinner("📥 Loading GO terms and pathways..."):
+            load_sections(records)
+        _, go_table, pathway_table = records_to_frames(records)
+        st.session_state['go_table'] = go_table
+        st.session_state['pathway_table'] = pathway_table
+    incidence = IncidenceMatrix(results_terms(go_table, pathway_table))
+elif background_choice == BACKGROUND_INDEX:
+    incidence = index_background(config.LOCAL_INDEX_PATH, os.path.getmtime(config.LOCAL_INDEX_PATH))
+else:
+    col_go_file, col_path_file = st.columns(2)
+    with col_go_file:
+        go_file = st.file_uploader("GO table (<name>.go.parquet)", type=["parquet"])
+    with col_path_file:
+        pathway_file = st.file_uploader("Pathway table (<name>.pathways.parquet)", type=["parquet"])
+    if not go_file and not pathway_file:
+        st.info("Upload background annotation tables written by `python -m gene2function annotate`.")
+        st.stop()
+    incidence = file_background(go_file.getvalue() if go_file else None, pathway_file.getvalue() if pathway_file else None)
+
+# -----------------------
+# Run enrichment
+# -----------------------
+col_overlap, col_fdr, col_top = st.columns(3)
+with col_overlap:
+    min_overlap = st.number_input("Minimum overlapping genes", min_value=1, max_value=50, value=2, step=1)
+with col_fdr:
+    fdr_cutoff = st.slider("FDR cutoff", min_value=0.001, max_value=1.0, value=0.05, step=0.001, format="%.3f")
+with col_top:
+    top_n = st.slider("Terms to plot", min_value=5, max_value=50, value=20, step=5)
+
+with st.spinner("Computing enrichment..."):
+    enrichment = enrich(incidence, query_genes, min_overlap=int(min_overlap))
+
+st.caption(f"{len(set(query_genes))} query gene(s) against {len(incidence.genes)} background gene(s) and {len(incidence.term_ids)} term(s).")
+
+if enrichment.empty:
+    st.info("No terms overlap the query genes.")
+    st.stop()
+
+sources = sorted(enrichment["source"].unique())
+selected_sources = st.multiselect("Sources", sources, default=sources)
+significant = enrichment[(enrichment["fdr"] <= fdr_cutoff) & enrichment["source"].isin(selected_sources)]
+
+st.markdown(f"### 📋 Enriched Terms ({len(significant)} at FDR ≤ {fdr_cutoff:g})")
+st.dataframe(significant, use_container_width=True, hide_index=True,
+             column_config={
+                 "p_value": st.column_config.NumberColumn(format="%.2e"),
+                 "fdr": st.column_config.NumberColumn(format="%.2e"),
+                 "fold_enrichment": st.column_config.NumberColumn(format="%.2f"),
+             })
+
+if not significant.empty:
+    st.markdown("### 📈 Top Enriched Terms")
+    plot_df = significant.head(top_n).copy()
+    plot_df["-log10(FDR)"] = -np.log10(plot_df["fdr"].clip(lower=1e-300))
+    plot_type = st.radio("Plot type", ["Dot plot", "Bar plot"], horizontal=True)
+    if plot_type == "Dot plot":
+        fig = px.scatter(plot_df, x="fold_enrichment", y="term_name", size="overlap", color="-log10(FDR)",
+                         hover_data=["source", "term_id", "overlap", "term_size", "fdr"],
+                         template="plotly_white", height=max(400, 28 * len(plot_df)))
+    else:
+        fig = px.bar(plot_df, x="-log10(FDR)", y="term_name", color="source", orientation="h",
+                     hover_data=["term_id", "overlap", "term_size", "fold_enrichment"],
+                     template="plotly_white", height=max(400, 28 * len(plot_df)))
+    fig.update_layout(yaxis=dict(autorange="reversed", title=None), margin=dict(l=20, r=20, t=30, b=20))
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.download_button(
+        label="⬇️ Download Enrichment Results as CSV",
+        data=significant.to_csv(index=False).encode("utf-8"),
+        file_name="gene2function_enrichment.csv",
+        mime="text/csv"
+    )
+else:
+    st.info("No terms pass the FDR cutoff.")
@@ -0,0 +1,217 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for mygene.info's /v3/query endpoint (GET single query, POST querymany),
+# serving synthetic or recorded hits with configurable latency, error rate and payload size.
+# Used by run_benchmarks.py; can also be run on its own and targeted with G2F_MYGENE_URL:
+#   python benchmarks/mock_mygene.py --port 8765 --latency-ms 80
+#   G2F_MYGENE_URL=http://127.0.0.1:8765/v3/query streamlit run app/main.py
+
+GO_CATEGORY_KEYS = ("BP", "CC", "MF")
+PATHWAY_DBS = ("kegg", "reactome", "wikipathways", "biocarta", "pid")
+
+
+class MockSettings:
+    def __init__(self, latency_ms=50.0, latency_per_gene_ms=0.05, jitter_ms=10.0, error_rate=0.0,
+                 notfound_rate=0.05, duplicate_rate=0.01, go_terms=30, pathways=8, term_pool=5000,
+                 recorded=None, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_per_gene_ms = latency_per_gene_ms
+        self.jitter_ms = jitter_ms
+        # Fraction of requests answered with a 503 (retried by the client)
+        self.error_rate = error_rate
+        # Fractions of queries that match nothing / more than one gene
+        self.notfound_rate = notfound_rate
+        self.duplicate_rate = duplicate_rate
+        # Average GO annotations and pathway memberships per gene (payload size), drawn
+        # from `term_pool` distinct terms
+        self.go_terms = go_terms
+        self.pathways = pathways
+        self.term_pool = term_pool
+        # {query (upper case): hit or list of hits} recorded from the real API; queries not
+        # in it fall back to synthetic hits
+        self.recorded = {k.upper(): v for k, v in (recorded or {}).items()}
+        self.seed = seed
+
+    def to_dict(self):
+        return {k: v for k, v in vars(self).items() if k != "recorded"} | {"recorded_queries": len(self.recorded)}
+
+
+def _fraction(query, salt):
+    # Deterministic pseudo-random number in [0, 1) per query, so runs are comparable
+    return zlib.crc32(f"{salt}:{query}".encode()) / 2 ** 32
+
+
+def synthetic_hit(query, settings, variant=0):
+    key = query.split(":", 1)[-1].upper()
+    seed = zlib.crc32(f"{settings.seed}:{variant}:{key}".encode())
+    rng = random.Random(seed)
+    gene_id = seed % 10 ** 6
+
+    go = {category: [] for category in GO_CATEGORY_KEYS}
+    for _ in range(rng.randint(0, 2 * settings.go_terms)):
+        term = rng.randrange(settings.term_pool)
+        go[GO_CATEGORY_KEYS[term % 3]].append({
+            "id": f"GO:{term:07d}", "term": f"synthetic process {term}",
+            "evidence": rng.choice(("IEA", "IDA", "TAS", "IBA")), "qualifier": "involved_in",
+            "pubmed": [rng.randrange(10 ** 7) for _ in range(rng.randint(0, 3))],
+        })
+    pathway = {}
+    for _ in range(rng.randint(0, 2 * settings.pathways)):
+        pid = rng.randrange(settings.term_pool // 5 or 1)
+        db = PATHWAY_DBS[pid % len(PATHWAY_DBS)]
+        pathway.setdefault(db, []).append({"id": f"{db.upper()}-{pid:05d}", "name": f"synthetic {db} pathway {pid}"})
+
+    return {
+        "query": query, "_id": str(gene_id), "_score": 20.0 - variant,
+        "symbol": key if not variant else f"{key}P{variant}",
+        "name": f"synthetic protein {key.lower()}",
+        "summary": f"Synthetic gene {key} served by the benchmark mock. " * rng.randint(1, 6),
+        "entrezgene": gene_id, "taxid": 9606, "pharmgkb": f"PA{gene_id}",
+        "uniprot": {"Swiss-Prot": f"Q{gene_id:06d}"},
+        "go": {category: terms for category, terms in go.items() if terms},
+        "pathway": pathway,
+    }
+
+
+def _project(hit, fields):
+    # Keep only the requested top-level fields, like the real API's `fields` parameter
+    if not fields or fields == "all":
+        return hit
+    keep = set(fields.split(",")) | {"query", "_id", "_score"}
+    return {k: v for k, v in hit.items() if k in keep}
+
+
+def hits_for(query, settings, fields=None):
+    # All hits for one query, as the querymany endpoint lists them
+    recorded = settings.recorded.get(query.split(":", 1)[-1].upper())
+    if recorded is not None:
+        hits = recorded if isinstance(recorded, list) else [recorded]
+        return [_project(dict(hit, query=query), fields) for hit in hits]
+    if _fraction(query, "notfound") < settings.notfound_rate:
+        return []
+    hits = [synthetic_hit(query, settings)]
+    if _fraction(query, "duplicate") < settings.duplicate_rate:
+        hits.append(synthetic_hit(query, settings, variant=1))
+    return [_project(hit, fields) for hit in hits]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings = MockSettings()
+    stats = None
+
+    def log_message(self, *args):
+        pass
+
+    def _delay(self, n_queries):
+        s = self.settings
+        delay = s.latency_ms + s.latency_per_gene_ms * n_queries + random.uniform(-s.jitter_ms, s.jitter_ms)
+        time.sleep(max(0.0, delay) / 1000)
+
+    def _send(self, status, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.stats["lock"]:
+            self.stats["requests"] += 1
+            self.stats["bytes_sent"] += len(body)
+            if status != 200:
+                self.stats["errors"] += 1
+
+    def _maybe_fail(self):
+        if self.settings.error_rate and random.random() < self.settings.error_rate:
+            self._send(503)
+            return True
+        return False
+
+    def do_GET(self):
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        query = params.get("q", [""])[0]
+        self._delay(1)
+        if self._maybe_fail():
+            return
+        hits = hits_for(query, self.settings, params.get("fields", [None])[0])
+        self._send(200, {"took": 1, "total": len(hits), "max_score": 20.0, "hits": hits})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+        queries = [q for q in form.get("q", [""])[0].split(",") if q]
+        self._delay(len(queries))
+        if self._maybe_fail():
+            return
+        out = []
+        fields = form.get("fields", [None])[0]
+        for query in queries:
+            out.extend(hits_for(query, self.settings, fields) or [{"query": query, "notfound": True}])
+        self._send(200, out)
+
+
+def start_server(settings=None, host="127.0.0.1", port=0):
+    # Serve on a background thread; returns (server, query URL). Request counters are
+    # in server.stats; call server.shutdown() to stop.
+    handler = type("BoundMockHandler", (MockHandler,), {
+        "settings": settings or MockSettings(),
+        "stats": {"lock": threading.Lock(), "requests": 0, "errors": 0, "bytes_sent": 0},
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stats = handler.stats
+    threading.Thread(target=server.serve_forever, name="mock-mygene", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v3/query"
+
+
+def add_settings_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Base latency per request (default: 50)")
+    parser.add_argument("--latency-per-gene-ms", type=float, default=0.05, help="Extra latency per queried gene (default: 0.05)")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Uniform latency jitter, +/- (default: 10)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503 (default: 0)")
+    parser.add_argument("--notfound-rate", type=float, default=0.05, help="Fraction of queries with no match (default: 0.05)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.01, help="Fraction of queries matching two genes (default: 0.01)")
+    parser.add_argument("--go-terms", type=int, default=30, help="Average GO annotations per gene (default: 30)")
+    parser.add_argument("--pathways", type=int, default=8, help="Average pathways per gene (default: 8)")
+    parser.add_argument("--recorded", help="JSON file of recorded hits, {query: hit or [hits]}")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic payloads")
+
+
+def settings_from_args(args):
+    recorded = None
+    if args.recorded:
+        with open(args.recorded, encoding="utf-8") as f:
+            recorded = json.load(f)
+    return MockSettings(latency_ms=args.latency_ms, latency_per_gene_ms=args.latency_per_gene_ms,
+                        jitter_ms=args.jitter_ms, error_rate=args.error_rate, notfound_rate=args.notfound_rate,
+                        duplicate_rate=args.duplicate_rate, go_terms=args.go_terms, pathways=args.pathways,
+                        recorded=recorded, seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the mygene.info query API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server, url = start_server(settings_from_args(args), args.host, args.port)
+    # The URL goes first on its own line, so a parent process can read it (with --port 0)
+    print(url, flush=True)
+    print("Serving mock mygene.info (Ctrl+C to stop)", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# End-to-end benchmarks for the annotation pipeline, run fully offline against the local
+# mygene.info stand-in in mock_mygene.py (started in a separate process so the server does
+# not compete with the client for the GIL). For each input size it measures:
+#   annotate      - the upload path: an AnnotationJob over the gene list (cold cache), plus
+#                   the deferred GO/pathway fetch when a light --profile is used
+#   annotate_warm - the same list again, served from the SQLite cache
+#   single        - search_gene_function latency, as used for the text input
+#   frames        - records_to_frames + flat_table (the session tables and CLI output)
+#   plots         - GO/pathway aggregates and the Plotly figures shown on the main page
+#   table_page    - a full render of pages/1_Gene_Table.py (needs streamlit)
+#   memory        - peak traced Python memory for annotate + frames (separate pass)
+#   stages        - per-stage totals from utils.metrics (with --metrics)
+# Results are written as JSON; pass --compare to diff against an earlier run:
+#   python benchmarks/run_benchmarks.py -o bench.json
+#   python benchmarks/run_benchmarks.py --sizes 10 1000 -o new.json --compare bench.json
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.abspath(os.path.join(BENCH_DIR, '..')))
+
+from mock_mygene import add_settings_arguments  # noqa: E402
+from utils import config, fetch, metrics  # noqa: E402
+import utils.helpers as helpers  # noqa: E402
+
+DEFAULT_SIZES = [10, 1000, 10000, 50000]
+# Metrics where a larger value is better; everything else is a time or a size
+HIGHER_IS_BETTER = ("genes_per_sec",)
+NOISE_FLOOR_SECONDS = 0.05
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else None
+
+
+def start_mock(args):
+    # Run the mock server in its own process and read its URL from the first output line
+    cmd = [sys.executable, os.path.join(BENCH_DIR, "mock_mygene.py"), "--port", "0",
+           "--latency-ms", str(args.latency_ms), "--latency-per-gene-ms", str(args.latency_per_gene_ms),
+           "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate),
+           "--notfound-rate", str(args.notfound_rate), "--duplicate-rate", str(args.duplicate_rate),
+           "--go-terms", str(args.go_terms), "--pathways", str(args.pathways), "--seed", str(args.seed)]
+    if args.recorded:
+        cmd += ["--recorded", args.recorded]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+class RequestTimer:
+    # Records the wall time of every upstream request made through utils.helpers
+    def __init__(self):
+        self.samples = []
+        self._original = helpers.request_json
+
+    def __enter__(self):
+        def timed(*a, **kw):
+            started = time.perf_counter()
+            try:
+                return self._original(*a, **kw)
+            finally:
+                self.samples.append(time.perf_counter() - started)
+        helpers.request_json = timed
+        return self
+
+    def __exit__(self, *exc):
+        helpers.request_json = self._original
+
+
+def fresh_cache(workdir, name):
+    # Point the (process-wide) annotation cache at a new, empty file
+    import utils.cache as cache_module
+    if cache_module._default_cache is not None:
+        cache_module._default_cache.close()
+    cache_module._default_cache = None
+    config.CACHE_ENABLED = True
+    config.CACHE_PATH = os.path.join(workdir, f"{name}.sqlite")
+
+
+def run_job(genes, workdir, name, max_workers):
+    from utils.jobs import AnnotationJob
+    job = AnnotationJob(name, genes, jobs_dir=os.path.join(workdir, "jobs"), max_workers=max_workers)
+    started = time.perf_counter()
+    progress = job.start().wait().progress()
+    seconds = time.perf_counter() - started
+    if progress["status"] != "done":
+        raise RuntimeError(f"annotation job {name} {progress['status']}: {progress['error']}")
+    return job.results(), seconds
+
+
+def bench_annotate(genes, workdir, args):
+    fresh_cache(workdir, f"cold-{len(genes)}")
+    with RequestTimer() as timer:
+        entries, seconds = run_job(genes, workdir, f"cold-{len(genes)}", args.workers)
+    statuses = [e["status"] for e in entries]
+    # With a light field profile the views fetch GO/pathway sections afterwards
+    started = time.perf_counter()
+    helpers.load_sections([e["result"] for e in entries if e["result"] is not None], max_workers=args.workers)
+    sections_seconds = time.perf_counter() - started
+    annotate = {
+        "seconds": seconds,
+        "genes_per_sec": len(genes) / seconds if seconds else None,
+        "requests": len(timer.samples),
+        "request_p50_ms": percentile_ms(timer.samples, 50),
+        "request_p95_ms": percentile_ms(timer.samples, 95),
+        "load_sections_seconds": sections_seconds,
+        "found": statuses.count("found") + statuses.count("duplicate"),
+        "notfound": statuses.count("notfound"),
+        "errors": statuses.count("error"),
+    }
+
+    # Same list again with the cache now populated
+    _, warm_seconds = run_job(genes, workdir, f"warm-{len(genes)}", args.workers)
+    annotate_warm = {"seconds": warm_seconds, "genes_per_sec": len(genes) / warm_seconds if warm_seconds else None}
+    return entries, annotate, annotate_warm
+
+
+def bench_single(genes, args):
+    samples = []
+    for gene in genes[:args.single_sample]:
+        started = time.perf_counter()
+        helpers.search_gene_function(gene, use_cache=False)
+        samples.append(time.perf_counter() - started)
+    return {"calls": len(samples), "p50_ms": percentile_ms(samples, 50), "p95_ms": percentile_ms(samples, 95)}
+
+
+def bench_frames(entries):
+    from utils.models import flat_table, records_to_frames
+    records = [e["result"] for e in entries if e["result"] is not None]
+    started = time.perf_counter()
+    genes, go, pathways = records_to_frames(records)
+    frames_seconds = time.perf_counter() - started
+    flat_table(genes, go, pathways)
+    return (genes, go, pathways), {
+        "seconds": frames_seconds,
+        "flat_seconds": time.perf_counter() - started - frames_seconds,
+        "gene_rows": len(genes), "go_rows": len(go), "pathway_rows": len(pathways),
+    }
+
+
+def bench_plots(go, pathways):
+    import plotly.express as px
+    from utils.aggregate import compute_aggregates, top_terms_for_category
+    started = time.perf_counter()
+    aggregates = compute_aggregates(go, pathways, top_n=10)
+    aggregate_seconds = time.perf_counter() - started
+    # Build and serialize the same figures as app/main.py (serialization is what st.plotly_chart pays)
+    for category in ("Biological Process", "Cellular Component", "Molecular Function"):
+        plot_df = top_terms_for_category(aggregates, category)
+        if not plot_df.empty:
+            px.pie(plot_df, values="Count", names="Term", hole=0.4, template="plotly_white").to_json()
+    if not aggregates["pathway_dbs"].empty:
+        px.pie(aggregates["pathway_dbs"], values="Number of Genes", names="Pathway Database",
+               hole=0.3, template="plotly_white").to_json()
+    return {"seconds": time.perf_counter() - started, "aggregate_seconds": aggregate_seconds}
+
+
+def bench_table_page(genes, go, pathways):
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return None
+    page = os.path.join(BENCH_DIR, "..", "app", "pages", "1_Gene_Table.py")
+    app = AppTest.from_file(page, default_timeout=600)
+    app.session_state["gene_table"] = genes
+    app.session_state["go_table"] = go
+    app.session_state["pathway_table"] = pathways
+    started = time.perf_counter()
+    app.run()
+    seconds = time.perf_counter() - started
+    if app.exception:
+        raise RuntimeError(f"table page failed: {app.exception[0].message}")
+    return {"seconds": seconds}
+
+
+def bench_memory(genes, workdir, args):
+    fresh_cache(workdir, f"memory-{len(genes)}")
+    tracemalloc.start()
+    try:
+        entries, _ = run_job(genes, workdir, f"memory-{len(genes)}", args.workers)
+        bench_frames(entries)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak_mb": peak / 2 ** 20}
+
+
+def max_rss_mb():
+    # Peak resident size of this process; the resource module is Unix-only, so elsewhere
+    # only the traced peaks from bench_memory are reported
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+def run_size(size, workdir, args):
+    genes = [f"BENCH{i}" for i in range(size)]
+    metrics.reset()
+    print(f"[{size} genes] annotating...", file=sys.stderr, flush=True)
+    entries, annotate, annotate_warm = bench_annotate(genes, workdir, args)
+    result = {"genes": size, "annotate": annotate, "annotate_warm": annotate_warm}
+    result["single"] = bench_single(genes, args)
+    (gene_table, go, pathways), result["frames"] = bench_frames(entries)
+    result["plots"] = bench_plots(go, pathways)
+    if not args.skip_ui:
+        print(f"[{size} genes] rendering table page...", file=sys.stderr, flush=True)
+        result["table_page"] = bench_table_page(gene_table, go, pathways)
+    if not args.skip_memory:
+        print(f"[{size} genes] measuring memory...", file=sys.stderr, flush=True)
+        result["memory"] = bench_memory(genes, workdir, args)
+    if metrics.enabled():
+        # Total seconds per instrumented stage, across all of the passes above
+        result["stages"] = {h["labels"]["stage"]: h["sum"] for h in metrics.snapshot()["histograms"]
+                            if h["name"] == metrics.STAGE_METRIC}
+    return result
+
+
+def flatten(result, prefix=""):
+    out = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            out.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[f"{prefix}{key}"] = value
+    return out
+
+
+def compare(current, baseline, threshold, out=sys.stdout):
+    # Print relative changes per size; returns the number of metrics that regressed by more than `threshold`
+    regressions = 0
+    baseline_by_size = {r["genes"]: flatten(r) for r in baseline["results"]}
+    for result in current["results"]:
+        before = baseline_by_size.get(result["genes"])
+        if before is None:
+            continue
+        print(f"\n{result['genes']} genes:", file=out)
+        for metric, value in flatten(result).items():
+            old = before.get(metric)
+            if metric == "genes" or not old or value is None or not metric.endswith(("seconds", "_ms", "_mb", "genes_per_sec")):
+                continue
+            # Sub-50ms timings are mostly scheduler noise
+            if metric.endswith("seconds") and max(old, value) < NOISE_FLOOR_SECONDS:
+                continue
+            change = (value - old) / old
+            worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+            flag = ""
+            if worse > threshold:
+                flag = "  <-- regression"
+                regressions += 1
+            print(f"  {metric:32s} {old:12.4g} -> {value:12.4g}  {change:+7.1%}{flag}", file=out)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark Gene2Function against a local mock mygene.info")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help=f"Gene list sizes (default: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative slowdown reported as a regression with --compare (default: 0.2)")
+    parser.add_argument("-w", "--workers", type=int, default=config.MAX_CONCURRENCY,
+                        help=f"Concurrent requests (default: {config.MAX_CONCURRENCY})")
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="Client rate limit in requests/s (default: 1000, i.e. effectively off; "
+                             f"use {config.RATE_LIMIT_PER_SEC:g} to include the production throttle)")
+    parser.add_argument("--profile", choices=tuple(helpers.FIELD_PROFILES), default=config.FIELD_PROFILE,
+                        help=f"Field profile for the initial lookups (default: {config.FIELD_PROFILE})")
+    parser.add_argument("--single-sample", type=int, default=50, help="Single-gene lookups timed per size (default: 50)")
+    parser.add_argument("--skip-ui", action="store_true", help="Skip the table page render")
+    parser.add_argument("--skip-memory", action="store_true", help="Skip the traced-memory pass")
+    parser.add_argument("--metrics", action="store_true", help="Enable utils.metrics and record per-stage totals")
+    add_settings_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    process, url = start_mock(args)
+    if not url:
+        raise SystemExit("mock server failed to start")
+    helpers.MYGENE_QUERY_URL = url
+    metrics.enable(args.metrics)
+    config.ALIAS_TABLE_PATH = None
+    config.OFFLINE = False
+    config.BACKEND = "mygene"
+    config.FIELD_PROFILE = args.profile
+    fetch.configure(max_concurrency=args.workers, rate_limit=args.rate, rate_burst=max(1, int(args.rate)))
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "workers": args.workers,
+            "rate_limit": args.rate,
+            "job_chunk_size": config.JOB_CHUNK_SIZE,
+            "field_profile": args.profile,
+        },
+        "server": {k: getattr(args, k) for k in ("latency_ms", "latency_per_gene_ms", "jitter_ms", "error_rate",
+                                                  "notfound_rate", "duplicate_rate", "go_terms", "pathways",
+                                                  "recorded", "seed")},
+        "results": [],
+    }
+    try:
+        with tempfile.TemporaryDirectory(prefix="g2f-bench-") as workdir:
+            for size in args.sizes:
+                result = run_size(size, workdir, args)
+                report["results"].append(result)
+                annotate = result["annotate"]
+                print(f"{size:>7} genes: {annotate['genes_per_sec']:.0f} genes/s cold, "
+                      f"{result['annotate_warm']['genes_per_sec']:.0f} genes/s warm, "
+                      f"request p50/p95 {annotate['request_p50_ms']:.0f}/{annotate['request_p95_ms']:.0f} ms, "
+                      f"frames {result['frames']['seconds']:.2f}s, plots {result['plots']['seconds']:.2f}s"
+                      + (f", table page {result['table_page']['seconds']:.2f}s" if result.get("table_page") else "")
+                      + (f", peak {result['memory']['peak_mb']:.0f} MB" if result.get("memory") else ""))
+    finally:
+        process.terminate()
+        process.wait()
+
+    report["meta"]["max_rss_mb"] = max_rss_mb()
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        print(f"\n{regressions} regression(s) above {args.threshold:.0%}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2 @@
+# Headless entry points for Gene2Function (see `python -m gene2function --help`).
+# Deliberately free of Streamlit/Plotly imports so it starts quickly in cron jobs and containers.
@@ -0,0 +1,3 @@
+from gene2function.cli import main
+
+raise SystemExit(main())
@@ -0,0 +1,275 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import config, fetch, metrics
+from utils.cache import AnnotationCache
+from utils.helpers import FIELD_PROFILES, MAX_BATCH_SIZE, load_sections
+from utils.ingest import SUPPORTED_EXTENSIONS, file_extension, iter_genes, read_columns
+from utils.jobs import UNSETTLED_STATUSES, AnnotationJob
+from utils.local_index import build_index
+from utils.models import flat_table, records_to_frames
+
+OUTPUT_FORMATS = ("parquet", "csv", "jsonl")
+# Tables written per input file: <stem>.<table>.<format>
+OUTPUT_TABLES = ("flat", "go", "pathways", "status")
+
+
+def write_table(df, path, fmt):
+    tmp_path = path + ".tmp"
+    if fmt == "parquet":
+        # Object columns can mix ints and strings (e.g. IDs); store them as strings
+        df = df.astype({col: "string" for col in df.columns if df[col].dtype == object})
+        df.to_parquet(tmp_path, index=False)
+    elif fmt == "csv":
+        df.to_csv(tmp_path, index=False)
+    else:
+        df.to_json(tmp_path, orient="records", lines=True)
+    # Write then rename, so a partially written file is never mistaken for finished output
+    os.replace(tmp_path, path)
+
+
+def file_stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def file_key(path):
+    # <stem>.<hash of the resolved path>: names the checkpoint and completion marker, so
+    # same-named inputs from different folders (or with different extensions) never share them
+    digest = hashlib.sha256(os.path.realpath(path).encode("utf-8")).hexdigest()[:10]
+    return f"{file_stem(path)}.{digest}"
+
+
+def output_paths(path, args):
+    stem = file_stem(path)
+    return {
+        (table, fmt): os.path.join(args.output_dir, f"{stem}.{table}.{fmt}")
+        for table in OUTPUT_TABLES for fmt in args.formats
+    }
+
+
+def annotate_file(path, args):
+    started = time.time()
+    stats = {"file": path, "genes": 0, "found": 0, "notfound": 0, "ambiguous": 0, "failed": 0,
+             "cache_hits": 0, "resumed": 0, "seconds": 0.0, "error": None, "skipped": False}
+
+    ext = file_extension(path)
+    if ext not in SUPPORTED_EXTENSIONS:
+        stats["error"] = f"unsupported file format: {ext}"
+        return stats
+
+    outputs = output_paths(path, args)
+    # Written only once every gene has a final answer; --resume skips files that have it
+    done_marker = os.path.join(args.output_dir, f"{file_key(path)}.done")
+    if args.resume and os.path.exists(done_marker) and all(os.path.exists(p) for p in outputs.values()):
+        stats["skipped"] = True
+        return stats
+
+    column = args.column or read_columns(path, ext)[0]
+    # Partial results are checkpointed next to the output as <stem>.<hash>.partial.jsonl
+    job_id = f"{file_key(path)}.partial"
+    checkpoint_path = os.path.join(args.output_dir, f"{job_id}.jsonl")
+    if not args.resume and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    # Outputs are about to be replaced, so no earlier marker for this stem still holds
+    for marker in glob.glob(os.path.join(glob.escape(args.output_dir), f"{glob.escape(file_stem(path))}.*.done")):
+        os.remove(marker)
+    job = AnnotationJob(job_id, lambda: iter_genes(path, ext, column),
+                        chunk_size=args.chunk_size, jobs_dir=args.output_dir, max_workers=args.workers)
+
+    progress = job.start().wait().progress()
+    stats["resumed"] = progress["resumed"]
+    stats["cache_hits"] = progress["cache_hits"]
+    if progress["status"] != "done":
+        stats["error"] = progress["error"] or progress["status"]
+        stats["seconds"] = time.time() - started
+        return stats
+
+    entries = job.results()
+    records = [e["result"] for e in entries if e["result"] is not None]
+    # Light profiles leave the GO/pathway sections out of the lookup; every output table
+    # needs them, so they are fetched now, in batch
+    load_sections(records, max_workers=args.workers)
+    incomplete = sum(1 for r in records if not r.is_complete())
+    genes, go, pathways = records_to_frames(records)
+    tables = {
+        "flat": flat_table(genes, go, pathways),
+        "go": go,
+        "pathways": pathways,
+        "status": pd.DataFrame([(e["input_gene"], e["status"], e["hit_count"], e.get("resolved_as"),
+                                 "|".join(e.get("candidates") or []), e.get("error")) for e in entries],
+                               columns=["input_gene", "status", "hit_count", "resolved_as", "candidates", "error"]),
+    }
+    for (table, fmt), out_path in outputs.items():
+        write_table(tables[table], out_path, fmt)
+
+    stats["genes"] = len(entries)
+    stats["found"] = len(records)
+    stats["notfound"] = sum(1 for e in entries if e["status"] in ("notfound", "uncached"))
+    stats["ambiguous"] = sum(1 for e in entries if e["status"] == "ambiguous")
+    # Genes whose sections could not be loaded count as failed too
+    stats["failed"] = sum(1 for e in entries if e["status"] == "error") + incomplete
+    # While genes are still failing (or were skipped offline) keep the checkpoint and leave
+    # the file unmarked, so --resume looks up only those genes (and their missing sections)
+    if not incomplete and not any(e["status"] in UNSETTLED_STATUSES for e in entries):
+        with open(done_marker, "w", encoding="utf-8") as f:
+            json.dump({"file": os.path.realpath(path), "genes": stats["genes"], "finished_at": time.time()}, f)
+        if os.path.exists(job.checkpoint_path):
+            os.remove(job.checkpoint_path)
+    stats["seconds"] = time.time() - started
+    return stats
+
+
+def print_summary(all_stats, elapsed, out=sys.stdout):
+    total_genes = 0
+    for stats in all_stats:
+        if stats["skipped"]:
+            print(f"{stats['file']}: skipped (output already complete)", file=out)
+            continue
+        if stats["error"]:
+            print(f"{stats['file']}: FAILED - {stats['error']}", file=out)
+            continue
+        total_genes += stats["genes"]
+        rate = stats["genes"] / stats["seconds"] if stats["seconds"] else 0.0
+        print(f"{stats['file']}: {stats['genes']} genes, {stats['found']} found, {stats['notfound']} not found, {stats['ambiguous']} ambiguous, "
+              f"{stats['failed']} failed, {stats['cache_hits']} cache hits, {stats['resumed']} resumed "
+              f"in {stats['seconds']:.1f}s ({rate:.1f} genes/s)", file=out)
+
+    processed = [s for s in all_stats if not s["skipped"] and not s["error"]]
+    cache_hits = sum(s["cache_hits"] for s in processed)
+    looked_up = sum(s["genes"] - s["resumed"] for s in processed)
+    print(f"Total: {total_genes} genes from {len(processed)} file(s) in {elapsed:.1f}s "
+          f"({total_genes / elapsed if elapsed else 0.0:.1f} genes/s), "
+          f"cache hit ratio {cache_hits / looked_up if looked_up else 0.0:.1%}, "
+          f"{sum(s['failed'] for s in processed)} failed gene(s), "
+          f"{sum(1 for s in all_stats if s['error'])} failed file(s)", file=out)
+
+
+def cmd_annotate(args):
+    if args.backend:
+        config.BACKEND = args.backend
+    if args.local_index:
+        config.LOCAL_INDEX_PATH = args.local_index
+    if args.offline:
+        config.OFFLINE = True
+    if args.no_cache:
+        config.CACHE_ENABLED = False
+    if args.metrics:
+        metrics.enable()
+    config.FIELD_PROFILE = args.profile
+    fetch.configure(max_concurrency=args.workers, rate_limit=args.rate)
+    args.formats = args.formats or ["parquet"]
+    args.chunk_size = args.chunk_size or args.workers * MAX_BATCH_SIZE
+    # Outputs are named after the file stem, so inputs sharing one would overwrite each other
+    by_stem = {}
+    for path in args.inputs:
+        by_stem.setdefault(file_stem(path), []).append(path)
+    clashes = [paths for paths in by_stem.values() if len(paths) > 1]
+    if clashes:
+        raise SystemExit("Input files would write the same outputs: "
+                         + "; ".join(", ".join(paths) for paths in clashes)
+                         + ". Annotate them into separate --output-dir directories.")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    started = time.time()
+    if args.jobs > 1 and len(args.inputs) > 1:
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            all_stats = list(executor.map(lambda p: annotate_file(p, args), args.inputs))
+    else:
+        all_stats = [annotate_file(p, args) for p in args.inputs]
+
+    print_summary(all_stats, time.time() - started)
+    if args.metrics:
+        metrics.write_dump(args.metrics)
+    return 1 if any(s["error"] or s["failed"] for s in all_stats) else 0
+
+
+def cmd_build_index(args):
+    pathway_tables = []
+    for spec in args.pathways or []:
+        db, sep, path = spec.partition("=")
+        if not sep:
+            raise SystemExit(f"--pathways expects DB=PATH, got: {spec}")
+        pathway_tables.append((db, path))
+
+    started = time.time()
+    counts = build_index(args.output, args.gene_info, gaf_files=args.gaf or [], obo=args.obo,
+                         uniprot_mapping=args.uniprot_mapping, pathway_tables=pathway_tables,
+                         taxid=args.taxid, species=args.species)
+    print(f"Built {args.output} in {time.time() - started:.1f}s: "
+          + ", ".join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items()))
+    return 0
+
+
+def cmd_cache(args):
+    cache = AnnotationCache(args.path)
+    if args.action == "invalidate":
+        if not args.genes:
+            raise SystemExit("cache invalidate expects one or more genes (symbols, IDs or queries)")
+        print(f"Removed {cache.invalidate(args.genes, species=args.species)} cached entries")
+    elif args.action == "clear":
+        print(f"Removed {cache.invalidate(species=args.species)} cached entries")
+    stats = cache.stats()
+    print(f"{stats['path']}: {stats['entries']} entries, {stats['bytes'] / 2 ** 20:.1f} MB")
+    cache.close()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="gene2function", description="Gene2Function headless tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    annotate = subparsers.add_parser("annotate", help="Annotate one or more gene-list files (CSV/TSV/XLSX)")
+    annotate.add_argument("inputs", nargs="+", help="Gene-list files")
+    annotate.add_argument("-c", "--column", help="Column holding gene symbols/IDs (default: first column)")
+    annotate.add_argument("-o", "--output-dir", default=".", help="Directory for result files (default: current directory)")
+    annotate.add_argument("-f", "--format", dest="formats", action="append", choices=OUTPUT_FORMATS,
+                          help="Output format; repeat for several (default: parquet)")
+    annotate.add_argument("-w", "--workers", type=int, default=config.MAX_CONCURRENCY,
+                          help=f"Concurrent requests to mygene.info (default: {config.MAX_CONCURRENCY})")
+    annotate.add_argument("-j", "--jobs", type=int, default=1, help="Input files processed in parallel (default: 1)")
+    annotate.add_argument("--rate", type=float, default=None, help="Maximum requests per second")
+    annotate.add_argument("--chunk-size", type=int, default=None, help="Genes per checkpointed step (default: workers x 1000)")
+    annotate.add_argument("--resume", action="store_true", help="Continue from partial output instead of starting over")
+    annotate.add_argument("--offline", action="store_true", help="Serve only from the local cache")
+    annotate.add_argument("--no-cache", action="store_true", help="Do not read or write the local cache")
+    annotate.add_argument("--profile", choices=tuple(FIELD_PROFILES), default="full",
+                          help="Fields to fetch; the light profiles skip GO terms and pathways (default: full)")
+    annotate.add_argument("--backend", choices=("mygene", "local"), help=f"Annotation backend (default: {config.BACKEND})")
+    annotate.add_argument("--local-index", help="Index file for the local backend")
+    annotate.add_argument("--metrics", metavar="PATH",
+                          help="Write stage timings, request latencies and counters to PATH (JSON if it ends in .json, else Prometheus text)")
+    annotate.set_defaults(func=cmd_annotate)
+
+    index = subparsers.add_parser("build-index", help="Compile bulk GO/pathway dumps into a local annotation index")
+    index.add_argument("-o", "--output", default=config.LOCAL_INDEX_PATH, help=f"Index file (default: {config.LOCAL_INDEX_PATH})")
+    index.add_argument("--gene-info", required=True, help="NCBI gene_info file (optionally .gz)")
+    index.add_argument("--gaf", action="append", help="GO annotation (GAF) file; repeat for several")
+    index.add_argument("--obo", help="GO ontology (go-basic.obo) for term names")
+    index.add_argument("--uniprot-mapping", help="UniProt idmapping.dat or idmapping_selected.tab")
+    index.add_argument("--pathways", action="append", metavar="DB=PATH",
+                       help="Pathway membership table, e.g. reactome=NCBI2Reactome.txt; repeat for several")
+    index.add_argument("--taxid", type=int, default=9606, help="Taxon to keep from gene_info (default: 9606)")
+    index.add_argument("--species", default="Homo sapiens", help="Species name used to filter Reactome tables")
+    index.set_defaults(func=cmd_build_index)
+
+    cache = subparsers.add_parser("cache", help="Inspect or invalidate the local annotation cache")
+    cache.add_argument("action", choices=("stats", "invalidate", "clear"),
+                       help="stats: show size; invalidate: drop the given genes under every query and scope; clear: drop everything")
+    cache.add_argument("genes", nargs="*", help="Genes to invalidate (symbols, Entrez IDs or other queries)")
+    cache.add_argument("--species", help="Only entries for this species (default: all)")
+    cache.add_argument("--path", default=config.CACHE_PATH, help=f"Cache file (default: {config.CACHE_PATH})")
+    cache.set_defaults(func=cmd_cache)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.helpers import DEFAULT_SCOPES, _upstream_query  # noqa: E402
+from utils.local_index import LocalIndex, build_index  # noqa: E402
+from utils.resolve import AliasIndex, classify, resolve_identifiers  # noqa: E402
+
+# Approved symbols that also match the UniProt accession pattern
+UNIPROT_LIKE_SYMBOLS = ["P2RY12", "B3GAT1", "B3GNT2", "H2BC12"]
+
+HGNC_ROWS = [
+    ("symbol", "status", "alias_symbol", "prev_symbol", "entrez_id", "ensembl_gene_id", "uniprot_ids"),
+    ("P2RY12", "Approved", "HORK3", "", "64805", "ENSG00000169313", "Q9H244"),
+    ("B3GAT1", "Approved", "CD57|HNK1", "", "27087", "ENSG00000109956", "Q9P2W7"),
+    ("B3GNT2", "Approved", "B3GNT1", "B3GNT1", "10678", "ENSG00000170340", "Q9NY97"),
+    ("H2BC12", "Approved", "H2BK", "HIST1H2BK", "85236", "ENSG00000197903", "O60814"),
+    ("TP53", "Approved", "P53", "", "7157", "ENSG00000141510", "P04637"),
+]
+
+
+@pytest.fixture
+def alias_index(tmp_path):
+    path = tmp_path / "hgnc.tsv"
+    path.write_text("\n".join("\t".join(row) for row in HGNC_ROWS) + "\n", encoding="utf-8")
+    return AliasIndex(str(path))
+
+
+@pytest.mark.parametrize("symbol", UNIPROT_LIKE_SYMBOLS)
+def test_uniprot_like_symbols_resolve_as_symbols(alias_index, symbol):
+    assert classify(symbol) == "uniprot"
+    resolution = resolve_identifiers([symbol.lower()], alias_index=alias_index)[0]
+    assert resolution["status"] == "resolved"
+    assert resolution["id_type"] == "symbol"
+    assert resolution["canonical"] == symbol
+    assert _upstream_query(resolution, DEFAULT_SCOPES) == ("symbol", symbol)
+
+
+def test_uniprot_like_previous_symbol_resolves(alias_index):
+    resolution = resolve_identifiers(["HIST1H2BK"], alias_index=alias_index)[0]
+    assert resolution["canonical"] == "H2BC12"
+
+
+def test_real_accession_still_resolves_through_cross_refs(alias_index):
+    resolution = resolve_identifiers(["P04637"], alias_index=alias_index)[0]
+    assert resolution["id_type"] == "uniprot"
+    assert resolution["canonical"] == "TP53"
+
+
+@pytest.mark.parametrize("symbol", UNIPROT_LIKE_SYMBOLS)
+def test_uniprot_like_symbols_keep_symbol_scopes_without_index(symbol):
+    resolution = resolve_identifiers([symbol], alias_index=None)[0]
+    assert resolution["status"] == "unresolved"
+    # Batch lookups search symbols and aliases as well as UniProt
+    assert _upstream_query(resolution, DEFAULT_SCOPES) == (DEFAULT_SCOPES, symbol)
+    assert _upstream_query(resolution, "symbol") == ("symbol,uniprot", symbol)
+    # Single lookups stay free text rather than becoming "uniprot:<symbol>"
+    assert _upstream_query(resolution, None) == (None, symbol)
+
+
+def test_other_id_types_keep_their_scope():
+    entrez, ensembl = resolve_identifiers(["7157", "ENSG00000141510.17"], alias_index=None)
+    assert _upstream_query(entrez, DEFAULT_SCOPES) == ("entrezgene", "7157")
+    assert _upstream_query(ensembl, DEFAULT_SCOPES) == ("ensembl.gene", "ENSG00000141510")
+
+
+def test_local_backend_reports_shared_synonyms_as_ambiguous(tmp_path, alias_index):
+    gene_info = tmp_path / "gene_info.tsv"
+    gene_info.write_text("9606\t1\tAAA\t-\tSHR|AX\t-\t1\t1p\tgene a\tprotein-coding\n"
+                         "9606\t2\tBBB\t-\tSHR\t-\t2\t2p\tgene b\tprotein-coding\n", encoding="utf-8")
+    build_index(str(tmp_path / "index.sqlite"), str(gene_info))
+    shared, unique = LocalIndex(str(tmp_path / "index.sqlite")).search_genes_batch(["shr", "ax"], alias_index=alias_index)
+    assert shared["status"] == "ambiguous"
+    assert shared["result"] is None
+    assert shared["candidates"] == ["AAA", "BBB"]
+    assert unique["status"] == "found"
+    assert unique["result"].gene_symbol == "AAA"
+    assert set(shared) == {"input_gene", "status", "hit_count", "result", "error", "cached",
+                           "id_type", "resolved_as", "candidates"}
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils import metrics
+
+# How many aggregate sets to keep; one per distinct result set seen recently
+_MEMO_SIZE = 8
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def result_hash(*tables):
+    # Content hash of the long-form result tables, used as the memoization key
+    parts = []
+    for table in tables:
+        if table is None or table.empty:
+            parts.append("empty")
+        else:
+            parts.append(f"{len(table)}:{int(pd.util.hash_pandas_object(table, index=False).sum()) & 0xFFFFFFFFFFFFFFFF:x}")
+    return "|".join(parts)
+
+
+def _go_aggregates(go_table, top_n):
+    if go_table is None or go_table.empty:
+        empty = pd.DataFrame(columns=["category", "term", "Count"])
+        return empty, empty.copy(), pd.Series(dtype="int64")
+
+    # One groupby over (category, term) gives every term count at once
+    term_counts = (go_table.groupby(["category", "term"], observed=True, sort=False)
+                   .size()
+                   .reset_index(name="Count")
+                   .sort_values(["category", "Count", "term"], ascending=[True, False, True], kind="stable"))
+    top_terms = term_counts.groupby("category", observed=True, sort=False).head(top_n)
+    # Number of distinct genes with at least one term in each category
+    coverage = go_table.groupby("category", observed=True)["input_gene"].nunique()
+    return term_counts, top_terms, coverage
+
+
+def _pathway_aggregates(pathway_table, top_n):
+    if pathway_table is None or pathway_table.empty:
+        return pd.DataFrame(columns=["Pathway Database", "Number of Pathways", "Number of Genes"])
+
+    db_counts = (pathway_table.groupby("db", observed=True)
+                 .agg(pathways=("pathway_id", "size"), genes=("input_gene", "nunique"))
+                 .reset_index()
+                 .rename(columns={"db": "Pathway Database", "pathways": "Number of Pathways", "genes": "Number of Genes"})
+                 .sort_values(["Number of Genes", "Pathway Database"], ascending=[False, True], kind="stable"))
+    db_counts["Pathway Database"] = db_counts["Pathway Database"].astype(str)
+    return db_counts.head(top_n) if top_n else db_counts
+
+
+def compute_aggregates(go_table, pathway_table, top_n=10):
+    # All counts needed by the visualization page, in one pass per table:
+    #   go_term_counts: every (category, term) with its annotation count
+    #   go_top_terms:   top_n terms per category
+    #   go_coverage:    distinct genes per GO category
+    #   pathway_dbs:    top_n pathway databases with pathway and gene counts
+    #   genes_with_go / genes_with_pathways: overall gene coverage
+    with metrics.timer("aggregates"):
+        return _compute_aggregates(go_table, pathway_table, top_n)
+
+
+def _compute_aggregates(go_table, pathway_table, top_n):
+    term_counts, top_terms, coverage = _go_aggregates(go_table, top_n)
+    return {
+        "go_term_counts": term_counts,
+        "go_top_terms": top_terms,
+        "go_coverage": coverage,
+        "pathway_dbs": _pathway_aggregates(pathway_table, top_n),
+        "genes_with_go": 0 if go_table is None or go_table.empty else go_table["input_gene"].nunique(),
+        "genes_with_pathways": 0 if pathway_table is None or pathway_table.empty else pathway_table["input_gene"].nunique(),
+    }
+
+
+def get_aggregates(go_table, pathway_table, top_n=10, version=None):
+    # Memoized compute_aggregates: reruns with the same result set (e.g. after a plot
+    # colour or legend change) reuse the counts instead of recomputing them.
+    # `version` names the result set cheaply (the app passes its job id and results
+    # version); without one the tables are content-hashed, a pass over every row.
+    key = (version if version is not None else result_hash(go_table, pathway_table), top_n)
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+
+    aggregates = compute_aggregates(go_table, pathway_table, top_n=top_n)
+
+    with _memo_lock:
+        _memo[key] = aggregates
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    return aggregates
+
+
+def top_terms_for_category(aggregates, category):
+    # Plot-ready (Term, Count) frame for one GO category display name
+    top = aggregates["go_top_terms"]
+    if top.empty:
+        return pd.DataFrame(columns=["Term", "Count"])
+    rows = top[top["category"].astype(str) == category]
+    return rows[["term", "Count"]].rename(columns={"term": "Term"}).reset_index(drop=True)
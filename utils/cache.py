@@ -0,0 +1,218 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils import config
+
+# SQLite caps the number of bound parameters per statement
+_SQL_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    key TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    species TEXT NOT NULL,
+    fields TEXT NOT NULL,
+    hit_json TEXT,
+    record_json TEXT,
+    hit_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    symbol TEXT,
+    entrez TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_annotations_query ON annotations(query);
+CREATE INDEX IF NOT EXISTS idx_annotations_accessed ON annotations(accessed_at);
+"""
+# Gene identity of each entry's hit, so a gene can be invalidated under every query and
+# scope it was cached by (symbol lookups, Entrez-keyed section loads, ...)
+_GENE_COLUMNS_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_annotations_symbol ON annotations(symbol);
+CREATE INDEX IF NOT EXISTS idx_annotations_entrez ON annotations(entrez);
+"""
+
+
+def normalize_query(query):
+    # mygene.info matches symbols and IDs case-insensitively
+    return str(query).strip().upper()
+
+
+def normalize_fields(fields):
+    return ",".join(sorted(f.strip() for f in fields.split(",") if f.strip()))
+
+
+def make_key(query, species, fields, scopes):
+    return "|".join([species, scopes, normalize_fields(fields), normalize_query(query)])
+
+
+def _entry_gene(query, hit, scopes):
+    # (upper-cased symbol, Entrez ID) an entry is about, either possibly None. Section-only
+    # hits carry neither field, but those are looked up by Entrez ID in the first place.
+    if scopes == "entrezgene":
+        return (normalize_query(hit["symbol"]) if hit and hit.get("symbol") else None), normalize_query(query)
+    if not hit:
+        return None, None
+    symbol = hit.get("symbol")
+    entrez = hit.get("entrezgene") or hit.get("_id")
+    return (normalize_query(symbol) if symbol else None,
+            str(entrez) if entrez is not None and str(entrez).isdigit() else None)
+
+
+class AnnotationCache:
+    # Persistent cache of mygene.info results, keyed by (query, species, scopes, fields).
+    # Each entry stores the raw best hit, the flattened record and the hit count; misses
+    # are cached too (hit_json NULL) so repeat runs need no network at all.
+    # Entries expire after `ttl_days`; beyond `max_entries` the least recently used are evicted.
+
+    def __init__(self, path=None, ttl_days=None, max_entries=None):
+        self.path = path or config.CACHE_PATH
+        self.ttl_seconds = (config.CACHE_TTL_DAYS if ttl_days is None else ttl_days) * 86400
+        self.max_entries = config.CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(annotations)")}
+        for column in ("symbol", "entrez"):
+            if column not in columns:
+                # Caches created before these columns existed
+                self._conn.execute(f"ALTER TABLE annotations ADD COLUMN {column} TEXT")
+        self._conn.executescript(_GENE_COLUMNS_SCHEMA)
+
+    def _is_fresh(self, created_at, now):
+        return self.ttl_seconds <= 0 or now - created_at < self.ttl_seconds
+
+    def get_many(self, queries, species, fields, scopes):
+        # Returns {query: {"hit", "record", "hit_count"}} for fresh entries only.
+        # Queries differing only in case/whitespace share a key, and each gets the entry.
+        keys = {}
+        for q in queries:
+            keys.setdefault(make_key(q, species, fields, scopes), []).append(q)
+        found = {}
+        now = time.time()
+        key_list = list(keys)
+        with self._lock:
+            for i in range(0, len(key_list), _SQL_CHUNK):
+                chunk = key_list[i:i + _SQL_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, hit_json, record_json, hit_count, created_at FROM annotations WHERE key IN ({placeholders})",
+                    chunk).fetchall()
+                fresh_keys = []
+                for key, hit_json, record_json, hit_count, created_at in rows:
+                    if not self._is_fresh(created_at, now):
+                        continue
+                    fresh_keys.append(key)
+                    entry = {
+                        "hit": json.loads(hit_json) if hit_json else None,
+                        "record": json.loads(record_json) if record_json else None,
+                        "hit_count": hit_count
+                    }
+                    for q in keys[key]:
+                        found[q] = entry
+                if fresh_keys:
+                    self._conn.execute(
+                        f"UPDATE annotations SET accessed_at = ? WHERE key IN ({','.join('?' * len(fresh_keys))})",
+                        [now] + fresh_keys)
+            self._conn.commit()
+        return found
+
+    def get(self, query, species, fields, scopes):
+        return self.get_many([query], species, fields, scopes).get(query)
+
+    def put_many(self, entries, species, fields, scopes):
+        # entries: iterable of (query, hit, record, hit_count); hit/record may be None for misses
+        now = time.time()
+        rows = [
+            (make_key(q, species, fields, scopes), normalize_query(q), species, normalize_fields(fields),
+             json.dumps(hit) if hit is not None else None,
+             json.dumps(record) if record is not None else None,
+             hit_count, now, now, *_entry_gene(q, hit, scopes))
+            for q, hit, record, hit_count in entries
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO annotations (key, query, species, fields, hit_json, record_json, hit_count, "
+                "created_at, accessed_at, symbol, entrez) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._evict()
+            self._conn.commit()
+
+    def put(self, query, hit, record, hit_count, species, fields, scopes):
+        self.put_many([(query, hit, record, hit_count)], species, fields, scopes)
+
+    def _evict(self):
+        if self.ttl_seconds > 0:
+            self._conn.execute("DELETE FROM annotations WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        if self.max_entries and self.max_entries > 0:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM annotations").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM annotations WHERE key IN (SELECT key FROM annotations ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,))
+
+    def invalidate(self, queries=None, species=None):
+        # Drop cached entries for the given queries (all species unless one is given),
+        # or everything when no queries are passed. A query naming a gene (symbol or Entrez
+        # ID) also drops every other entry for that gene, whatever query and scope cached it.
+        # Returns the number of entries removed.
+        with self._lock:
+            before = self._conn.total_changes
+            if queries is None:
+                if species is None:
+                    self._conn.execute("DELETE FROM annotations")
+                else:
+                    self._conn.execute("DELETE FROM annotations WHERE species = ?", (species,))
+            else:
+                species_sql, species_params = (" AND species = ?", [species]) if species is not None else ("", [])
+                normalized = [normalize_query(q) for q in queries]
+                for i in range(0, len(normalized), _SQL_CHUNK):
+                    chunk = normalized[i:i + _SQL_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    # The genes these queries stand for, by Entrez ID
+                    entrez = {q for q in chunk if q.isdigit()}
+                    entrez.update(row[0] for row in self._conn.execute(
+                        f"SELECT DISTINCT entrez FROM annotations WHERE entrez IS NOT NULL "
+                        f"AND (query IN ({placeholders}) OR symbol IN ({placeholders})){species_sql}",
+                        chunk + chunk + species_params))
+                    entrez = sorted(entrez)
+                    entrez_sql = f" OR entrez IN ({','.join('?' * len(entrez))})" if entrez else ""
+                    self._conn.execute(
+                        f"DELETE FROM annotations WHERE (query IN ({placeholders}) OR symbol IN ({placeholders}){entrez_sql})"
+                        f"{species_sql}", chunk + chunk + entrez + species_params)
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM annotations").fetchone()
+        size = os.path.getsize(self.path) if self.path != ":memory:" and os.path.exists(self.path) else 0
+        return {"entries": count, "bytes": size, "path": self.path}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache():
+    # Process-wide cache instance, or None when caching is disabled
+    global _default_cache
+    if not config.CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AnnotationCache()
+        return _default_cache
@@ -0,0 +1,70 @@
+import os
+
+# Runtime settings for talking to mygene.info. Every value can be overridden
+# with a G2F_* environment variable so deployments can tune them without code changes.
+
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+# mygene.info query endpoint; point it at a mirror or a local stand-in (see benchmarks/)
+MYGENE_URL = os.environ.get("G2F_MYGENE_URL") or "https://mygene.info/v3/query"
+# Maximum number of requests in flight at once
+MAX_CONCURRENCY = _env_int("G2F_MAX_CONCURRENCY", 4)
+# Token bucket: sustained requests per second and burst size.
+# mygene.info asks clients to stay around 10 requests/second.
+RATE_LIMIT_PER_SEC = _env_float("G2F_RATE_LIMIT", 8.0)
+RATE_LIMIT_BURST = _env_int("G2F_RATE_BURST", 8)
+# (connect, read) timeouts in seconds
+CONNECT_TIMEOUT = _env_float("G2F_CONNECT_TIMEOUT", 5.0)
+READ_TIMEOUT = _env_float("G2F_READ_TIMEOUT", 60.0)
+# Retries for 429/5xx responses and connection errors, with jittered exponential backoff
+MAX_RETRIES = _env_int("G2F_MAX_RETRIES", 5)
+BACKOFF_BASE = _env_float("G2F_BACKOFF_BASE", 0.5)
+BACKOFF_MAX = _env_float("G2F_BACKOFF_MAX", 30.0)
+
+# Local annotation cache (SQLite). TTL is in days; 0 disables expiry.
+CACHE_ENABLED = os.environ.get("G2F_CACHE", "1") not in ("0", "false", "no")
+CACHE_PATH = os.environ.get("G2F_CACHE_PATH") or os.path.join(os.path.expanduser("~"), ".cache", "gene2function", "annotations.sqlite")
+CACHE_TTL_DAYS = _env_float("G2F_CACHE_TTL_DAYS", 30.0)
+CACHE_MAX_ENTRIES = _env_int("G2F_CACHE_MAX_ENTRIES", 200000)
+# Offline mode: never touch the network, serve only what is already cached
+OFFLINE = os.environ.get("G2F_OFFLINE", "0") in ("1", "true", "yes")
+
+# Checkpoints for background annotation jobs (one JSONL file per uploaded gene list)
+JOBS_DIR = os.environ.get("G2F_JOBS_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "gene2function", "jobs")
+# Genes annotated (and checkpointed) per step of a background job
+JOB_CHUNK_SIZE = _env_int("G2F_JOB_CHUNK_SIZE", 500)
+# Jobs kept in memory for reruns to reattach to; older finished ones are dropped (their
+# checkpoints remain). Checkpoints expire like cache entries, after CACHE_TTL_DAYS.
+JOBS_MAX_IN_MEMORY = _env_int("G2F_JOBS_MAX_IN_MEMORY", 8)
+
+# Annotation backend: "mygene" (the mygene.info API) or "local" (an index built with
+# `python -m gene2function build-index`, for air-gapped deployments)
+BACKEND = os.environ.get("G2F_BACKEND", "mygene").lower()
+LOCAL_INDEX_PATH = os.environ.get("G2F_LOCAL_INDEX") or os.path.join(os.path.expanduser("~"), ".cache", "gene2function", "local_index.sqlite")
+
+# HGNC-style table (e.g. hgnc_complete_set.txt) used to resolve aliases, previous symbols
+# and cross-reference IDs locally before any lookup. Resolution is skipped when unset.
+ALIAS_TABLE_PATH = os.environ.get("G2F_ALIAS_TABLE") or None
+
+# Performance instrumentation (utils.metrics): stage timers, upstream latency histograms,
+# retry/error and cache counters. Shown in the app's diagnostics panel when enabled.
+METRICS_ENABLED = os.environ.get("G2F_METRICS", "0") in ("1", "true", "yes")
+
+# Fields fetched by the initial lookup: "minimal" (IDs and names), "standard" (adds summary,
+# UniProt and PharmGKB) or "full". Light profiles leave out the large GO and pathway
+# sections, which are then fetched in batch only when a view needs them.
+FIELD_PROFILE = os.environ.get("G2F_FIELD_PROFILE", "standard").lower()
+
+# Result exports (utils.export), written once per result set and reused; the oldest are
+# removed beyond EXPORT_MAX_FILES
+EXPORT_DIR = os.environ.get("G2F_EXPORT_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "gene2function", "exports")
+EXPORT_MAX_FILES = _env_int("G2F_EXPORT_MAX_FILES", 50)
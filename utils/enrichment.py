@@ -0,0 +1,166 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.special import gammaln
+
+from utils.models import GO_CATEGORIES
+
+# Long-form annotation table used for enrichment: one row per gene x term
+TERM_COLUMNS = ["gene", "source", "term_id", "term_name"]
+RESULT_COLUMNS = ["source", "term_id", "term_name", "overlap", "term_size", "query_size", "background_size",
+                  "fold_enrichment", "p_value", "fdr", "genes"]
+
+
+def annotation_terms(go_table, pathway_table, gene_col="gene_symbol"):
+    # Stack the gene x GO and gene x pathway tables into one gene x term table.
+    # GO terms are grouped by category, pathways by database.
+    parts = []
+    if go_table is not None and not go_table.empty:
+        parts.append(pd.DataFrame({
+            "gene": go_table[gene_col].astype(str).to_numpy(),
+            "source": go_table["category"].astype(str).to_numpy(),
+            "term_id": go_table["go_id"].astype(str).to_numpy(),
+            "term_name": go_table["term"].astype(str).to_numpy(),
+        }))
+    if pathway_table is not None and not pathway_table.empty:
+        db = pathway_table["db"].astype(str)
+        parts.append(pd.DataFrame({
+            "gene": pathway_table[gene_col].astype(str).to_numpy(),
+            "source": db.to_numpy(),
+            "term_id": (db + ":" + pathway_table["pathway_id"].astype(str)).to_numpy(),
+            "term_name": pathway_table["name"].fillna(pathway_table["pathway_id"]).astype(str).to_numpy(),
+        }))
+    if not parts:
+        return pd.DataFrame(columns=TERM_COLUMNS)
+    # Several evidence codes for one gene/term pair count once
+    return pd.concat(parts, ignore_index=True).drop_duplicates(["gene", "term_id"])
+
+
+def local_index_terms(index_path):
+    # Whole-genome background straight from a local annotation index (see utils.local_index)
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f"Local annotation index not found: {index_path}")
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    try:
+        go = pd.read_sql("""
+            SELECT DISTINCT g.symbol AS gene, t.category AS source, t.go_id AS term_id, t.term AS term_name
+            FROM gene_go gg JOIN genes g ON g.gene_key = gg.gene_key JOIN terms t ON t.term_key = gg.term_key
+        """, conn)
+        pathways = pd.read_sql("""
+            SELECT DISTINCT g.symbol AS gene, p.db AS source, p.db || ':' || p.pathway_id AS term_id,
+                   COALESCE(p.name, p.pathway_id) AS term_name
+            FROM gene_pathway gp JOIN genes g ON g.gene_key = gp.gene_key JOIN pathways p ON p.pathway_key = gp.pathway_key
+        """, conn)
+    finally:
+        conn.close()
+    go["source"] = go["source"].map(GO_CATEGORIES).fillna(go["source"])
+    return pd.concat([go, pathways], ignore_index=True)
+
+
+class IncidenceMatrix:
+    # Sparse boolean gene x term matrix over a background annotation set.
+    # Build it once per background and reuse it for any number of queries.
+
+    def __init__(self, terms):
+        gene_codes, self.genes = pd.factorize(terms["gene"])
+        term_codes, term_ids = pd.factorize(terms["term_id"])
+        self.term_ids = np.asarray(term_ids)
+        first = pd.DataFrame({"code": term_codes, "source": terms["source"].to_numpy(),
+                              "name": terms["term_name"].to_numpy()}).drop_duplicates("code").sort_values("code")
+        self.term_sources = first["source"].to_numpy()
+        self.term_names = first["name"].to_numpy()
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(gene_codes), dtype=np.int32), (gene_codes, term_codes)),
+            shape=(len(self.genes), len(self.term_ids)))
+        self.matrix.data[:] = 1  # collapse any duplicate pairs
+        self.gene_index = pd.Index(self.genes)
+        self.term_sizes = np.asarray(self.matrix.sum(axis=0)).ravel()
+        # Background size per source: genes with at least one term from that source
+        self.source_codes, self.sources = pd.factorize(self.term_sources)
+        source_incidence = sparse.csr_matrix(
+            (np.ones(len(self.term_ids), dtype=np.int32), (np.arange(len(self.term_ids)), self.source_codes)),
+            shape=(len(self.term_ids), len(self.sources)))
+        self._gene_source = (self.matrix @ source_incidence) > 0
+        self.source_sizes = np.asarray(self._gene_source.sum(axis=0)).ravel()
+
+
+def _log_comb(n, k):
+    return gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+
+
+def hypergeom_sf(k, N, K, n):
+    # P(X >= k) for X ~ Hypergeometric(N, K, n), vectorized over all terms: every term's
+    # tail k..min(K, n) is laid out in one flat array, its pmf evaluated in log space and
+    # summed back per term. Much faster than scipy.stats.hypergeom.sf on thousands of terms.
+    k, N, K, n = (np.asarray(a, dtype=np.int64) for a in (k, N, K, n))
+    span = np.maximum(np.minimum(K, n) - k + 1, 0)
+    term = np.repeat(np.arange(len(k)), span)
+    i = k[term] + np.arange(span.sum()) - np.repeat(np.cumsum(span) - span, span)
+    log_pmf = (_log_comb(K[term], i) + _log_comb(N[term] - K[term], n[term] - i)
+               - _log_comb(N[term], n[term]))
+    p_values = np.bincount(term, weights=np.exp(log_pmf), minlength=len(k))
+    return np.clip(np.where(k <= 0, 1.0, p_values), 0.0, 1.0)
+
+
+def benjamini_hochberg(p_values):
+    # BH-adjusted p-values (FDR), vectorized
+    p_values = np.asarray(p_values, dtype=float)
+    m = len(p_values)
+    if m == 0:
+        return p_values
+    order = np.argsort(p_values)
+    ranked = p_values[order] * m / np.arange(1, m + 1)
+    ranked = np.minimum.accumulate(ranked[::-1])[::-1]
+    fdr = np.empty(m)
+    fdr[order] = np.minimum(ranked, 1.0)
+    return fdr
+
+
+def enrich(incidence, query_genes, min_overlap=1, max_genes_listed=50):
+    # Hypergeometric over-representation test of every term at once.
+    # For a term in source S: N = background genes annotated in S, K = genes with the term,
+    # n = query genes annotated in S, k = query genes with the term; p = P(X >= k).
+    # FDR is Benjamini-Hochberg within each source (GO category / pathway database).
+    query_rows = incidence.gene_index.get_indexer(pd.unique(pd.Series(list(query_genes), dtype=str)))
+    query_rows = query_rows[query_rows >= 0]
+    if len(query_rows) == 0:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    query_matrix = incidence.matrix[query_rows]
+    overlap = np.asarray(query_matrix.sum(axis=0)).ravel()
+    query_source_sizes = np.asarray(incidence._gene_source[query_rows].sum(axis=0)).ravel()
+
+    tested = np.flatnonzero(overlap >= max(1, min_overlap))
+    if len(tested) == 0:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    source_codes = incidence.source_codes[tested]
+    N = incidence.source_sizes[source_codes]
+    K = incidence.term_sizes[tested]
+    n = query_source_sizes[source_codes]
+    k = overlap[tested]
+
+    p_values = hypergeom_sf(k, N, K, n)
+    results = pd.DataFrame({
+        "source": incidence.term_sources[tested],
+        "term_id": incidence.term_ids[tested],
+        "term_name": incidence.term_names[tested],
+        "overlap": k,
+        "term_size": K,
+        "query_size": n,
+        "background_size": N,
+        "fold_enrichment": (k / np.maximum(n, 1)) / (K / np.maximum(N, 1)),
+        "p_value": p_values,
+    })
+    results["fdr"] = results.groupby("source", sort=False)["p_value"].transform(benjamini_hochberg)
+
+    # Overlapping query genes per term, read column-wise from the query sub-matrix
+    query_csc = query_matrix[:, tested].tocsc()
+    query_gene_names = np.asarray(incidence.genes)[query_rows]
+    results["genes"] = [
+        ", ".join(query_gene_names[query_csc.indices[query_csc.indptr[j]:query_csc.indptr[j + 1]][:max_genes_listed]])
+        for j in range(len(tested))
+    ]
+    return results.sort_values(["fdr", "p_value", "term_id"], kind="stable").reset_index(drop=True)
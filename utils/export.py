@@ -0,0 +1,210 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import config, metrics
+from utils.aggregate import result_hash
+from utils.models import GENE_COLUMNS, GO_COLUMNS, PATHWAY_COLUMNS, flat_table, join_by_gene
+
+# Streaming export of annotation results. Tables are written chunk by chunk (EXPORT_CHUNK_ROWS
+# genes at a time) straight into the compressed file, so no full-size CSV/JSON string is ever
+# built. Each export is written once per result set, under its content hash in
+# config.EXPORT_DIR, and reused until evicted.
+
+EXPORT_CHUNK_ROWS = 5000
+# Exports used (written or reused) this recently are never evicted, so a file handed to
+# one session is not deleted while it is still being downloaded
+EVICT_GRACE_SECONDS = 600
+# gzip level for CSV/JSONL exports: on annotation text, level 4 compresses about twice as
+# fast as 6 (and far faster than the default 9) for files under 10% larger
+GZIP_LEVEL = 4
+# Export kind -> file suffix, MIME type and button label
+EXPORT_KINDS = {
+    "flat_csv": {"suffix": "flat.csv.gz", "mime": "application/gzip", "label": "Gene table (CSV, gzip)"},
+    "flat_parquet": {"suffix": "flat.parquet", "mime": "application/vnd.apache.parquet", "label": "Gene table (Parquet)"},
+    "go_parquet": {"suffix": "go.parquet", "mime": "application/vnd.apache.parquet", "label": "GO annotations (Parquet)"},
+    "pathways_parquet": {"suffix": "pathways.parquet", "mime": "application/vnd.apache.parquet", "label": "Pathways (Parquet)"},
+    "jsonl": {"suffix": "records.jsonl.gz", "mime": "application/gzip", "label": "Gene records (JSONL, gzip)"},
+}
+
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+
+
+def _gene_chunks(genes, go, pathways, chunk_rows):
+    # (genes, go, pathways) slices covering `chunk_rows` genes at a time, with each
+    # gene's GO/pathway rows picked out by position rather than by repeated filtering
+    go_positions = go.groupby("input_gene", sort=False).indices if go is not None and not go.empty else {}
+    pathway_positions = pathways.groupby("input_gene", sort=False).indices if pathways is not None and not pathways.empty else {}
+
+    def rows_for(table, positions, ids):
+        if not positions:
+            return table.iloc[0:0] if table is not None else None
+        picked = [positions[g] for g in ids if g in positions]
+        return table.iloc[np.concatenate(picked)] if picked else table.iloc[0:0]
+
+    for start in range(0, len(genes), chunk_rows):
+        chunk = genes.iloc[start:start + chunk_rows]
+        ids = chunk["input_gene"].to_numpy(dtype=object)
+        yield chunk, rows_for(go, go_positions, ids), rows_for(pathways, pathway_positions, ids)
+
+
+def _table_chunks(table, chunk_rows):
+    for start in range(0, len(table), chunk_rows):
+        yield table.iloc[start:start + chunk_rows]
+
+
+def _arrow_ready(df):
+    # Object columns can mix ints and strings (e.g. IDs) and categoricals differ per chunk;
+    # store both as strings so every row group has the same schema
+    return df.astype({col: "string" for col in df.columns
+                      if df[col].dtype == object or isinstance(df[col].dtype, pd.CategoricalDtype)})
+
+
+def _write_parquet_chunks(chunks, path, columns):
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(_arrow_ready(chunk), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+        if writer is None:
+            # No rows: still write a readable file with the expected columns
+            pq.write_table(pa.table({col: pa.array([], pa.string()) for col in columns}), path, compression="zstd")
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_flat_csv_gz(genes, go, pathways, path, chunk_rows=EXPORT_CHUNK_ROWS):
+    # One row per gene, with every annotation column (see utils.models.flat_table)
+    with gzip.open(path, "wt", compresslevel=GZIP_LEVEL, encoding="utf-8", newline="") as f:
+        header = True
+        for chunk in _gene_chunks(genes, go, pathways, chunk_rows):
+            flat_table(*chunk).to_csv(f, index=False, header=header)
+            header = False
+        if header:
+            pd.DataFrame(columns=GENE_COLUMNS + ["go_terms", "pathway"]).to_csv(f, index=False)
+
+
+def write_flat_parquet(genes, go, pathways, path, chunk_rows=EXPORT_CHUNK_ROWS):
+    _write_parquet_chunks((flat_table(*chunk) for chunk in _gene_chunks(genes, go, pathways, chunk_rows)),
+                          path, GENE_COLUMNS + ["go_terms", "pathway"])
+
+
+def write_table_parquet(table, path, columns, chunk_rows=EXPORT_CHUNK_ROWS * 10):
+    # Long-form tables (gene x GO term, gene x pathway) in row groups of `chunk_rows`
+    _write_parquet_chunks(_table_chunks(table, chunk_rows) if table is not None else (), path, columns)
+
+
+def _json_rows(df):
+    # One JSON object string per row, from pandas' C encoder (embedded newlines are escaped)
+    if df is None or df.empty:
+        return []
+    return df.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n").split("\n")
+
+
+def _json_lists(table, fields):
+    # {input_gene: comma-joined JSON objects of that gene's rows}
+    if table is None or table.empty:
+        return pd.Series(dtype=object)
+    return join_by_gene(table["input_gene"], pd.Series(_json_rows(table[fields]), dtype=object), ",")
+
+
+def write_jsonl_gz(genes, go, pathways, path, chunk_rows=EXPORT_CHUNK_ROWS):
+    # One JSON object per gene: the scalar gene fields plus nested "go" and "pathways" lists.
+    # Rows are serialized column-wise by pandas and spliced together, not built as dicts.
+    go_fields = [c for c in GO_COLUMNS if c not in ("input_gene", "gene_symbol")]
+    pathway_fields = [c for c in PATHWAY_COLUMNS if c not in ("input_gene", "gene_symbol")]
+    with gzip.open(path, "wt", compresslevel=GZIP_LEVEL, encoding="utf-8") as f:
+        for gene_chunk, go_chunk, pathway_chunk in _gene_chunks(genes, go, pathways, chunk_rows):
+            ids = gene_chunk["input_gene"]
+            go_lists = ids.map(_json_lists(go_chunk, go_fields)).fillna("")
+            pathway_lists = ids.map(_json_lists(pathway_chunk, pathway_fields)).fillna("")
+            gene_rows = _json_rows(gene_chunk[[c for c in GENE_COLUMNS if c in gene_chunk.columns]])
+            f.writelines(f'{row[:-1]},"go":[{go_list}],"pathways":[{pathway_list}]}}\n'
+                         for row, go_list, pathway_list in zip(gene_rows, go_lists, pathway_lists))
+
+
+def export_key(genes, go, pathways):
+    # Short content hash of a result set, used to name its export files
+    return hashlib.sha256(result_hash(genes, go, pathways).encode("utf-8")).hexdigest()[:20]
+
+
+def cached_export_path(genes, go, pathways, kind, export_dir=None, key=None):
+    # Path of an export already written for this result set, or None. Finding it counts as
+    # a use, so it is kept for EVICT_GRACE_SECONDS while the caller serves it.
+    path = os.path.join(export_dir or config.EXPORT_DIR, f"{key or export_key(genes, go, pathways)}.{EXPORT_KINDS[kind]['suffix']}")
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def _evict(export_dir):
+    # Keep only the most recently used EXPORT_MAX_FILES exports, plus any used within
+    # EVICT_GRACE_SECONDS
+    used = []
+    for name in os.listdir(export_dir):
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(export_dir, name)
+        try:
+            used.append((os.path.getmtime(path), path))
+        except OSError:
+            # Removed meanwhile by another session
+            continue
+    if len(used) <= config.EXPORT_MAX_FILES:
+        return
+    used.sort(reverse=True)
+    cutoff = time.time() - EVICT_GRACE_SECONDS
+    for mtime, path in used[config.EXPORT_MAX_FILES:]:
+        if mtime >= cutoff:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def export_results(genes, go, pathways, kind, export_dir=None, key=None):
+    # Write (or reuse) the `kind` export of this result set and return its path.
+    # Concurrent requests for the same export wait for the first writer instead of repeating it.
+    export_dir = export_dir or config.EXPORT_DIR
+    os.makedirs(export_dir, exist_ok=True)
+    path = os.path.join(export_dir, f"{key or export_key(genes, go, pathways)}.{EXPORT_KINDS[kind]['suffix']}")
+    with _path_locks_lock:
+        lock = _path_locks.setdefault(path, threading.Lock())
+    with lock:
+        if os.path.exists(path):
+            os.utime(path)
+            return path
+        # Write then rename, so a partial file is never served as a finished export
+        tmp_path = path + ".tmp"
+        with metrics.timer(f"export_{kind}"):
+            if kind == "flat_csv":
+                write_flat_csv_gz(genes, go, pathways, tmp_path)
+            elif kind == "flat_parquet":
+                write_flat_parquet(genes, go, pathways, tmp_path)
+            elif kind == "go_parquet":
+                write_table_parquet(go, tmp_path, GO_COLUMNS)
+            elif kind == "pathways_parquet":
+                write_table_parquet(pathways, tmp_path, PATHWAY_COLUMNS)
+            elif kind == "jsonl":
+                write_jsonl_gz(genes, go, pathways, tmp_path)
+            else:
+                raise ValueError(f"Unknown export kind: {kind}")
+        os.replace(tmp_path, path)
+        metrics.inc("g2f_exports_total", kind=kind)
+    _evict(export_dir)
+    return path
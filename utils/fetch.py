@@ -0,0 +1,149 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import config, metrics
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    # Raised when a request still fails after all retries.
+    # `transient` is True for rate limiting / server / network errors that may succeed later.
+    def __init__(self, message, status_code=None, transient=True):
+        super().__init__(message)
+        self.status_code = status_code
+        self.transient = transient
+
+
+class TokenBucket:
+    # Thread-safe token bucket: `rate` tokens per second, at most `capacity` stored
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = max(1, int(capacity))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_session = None
+_session_lock = threading.Lock()
+_bucket = TokenBucket(config.RATE_LIMIT_PER_SEC, config.RATE_LIMIT_BURST)
+_in_flight = threading.BoundedSemaphore(config.MAX_CONCURRENCY)
+
+
+def configure(max_concurrency=None, rate_limit=None, rate_burst=None):
+    # Override the concurrency and rate limits at runtime (e.g. from command-line flags).
+    # Call before issuing requests; the shared session is rebuilt with a matching pool.
+    global _bucket, _in_flight, _session
+    if max_concurrency is not None:
+        config.MAX_CONCURRENCY = max(1, int(max_concurrency))
+    if rate_limit is not None:
+        config.RATE_LIMIT_PER_SEC = float(rate_limit)
+    if rate_burst is not None:
+        config.RATE_LIMIT_BURST = int(rate_burst)
+    with _session_lock:
+        _bucket = TokenBucket(config.RATE_LIMIT_PER_SEC, config.RATE_LIMIT_BURST)
+        _in_flight = threading.BoundedSemaphore(config.MAX_CONCURRENCY)
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_session():
+    # Shared keep-alive session, with a connection pool sized for the worker pool
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.MAX_CONCURRENCY, pool_maxsize=config.MAX_CONCURRENCY)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _backoff_delay(attempt, retry_after=None):
+    # Honour Retry-After when the server sends one, otherwise use "full jitter" exponential backoff
+    if retry_after:
+        try:
+            return min(config.BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(config.BACKOFF_MAX, config.BACKOFF_BASE * (2 ** attempt)))
+
+
+def request_json(method, url, params=None, data=None):
+    session = get_session()
+    last_error = None
+
+    for attempt in range(config.MAX_RETRIES + 1):
+        _bucket.acquire()
+        retry_after = None
+        started = time.perf_counter()
+        try:
+            with _in_flight:
+                response = session.request(method, url, params=params, data=data,
+                                           timeout=(config.CONNECT_TIMEOUT, config.READ_TIMEOUT))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.observe("g2f_upstream_request_seconds", time.perf_counter() - started, method=method, status=type(e).__name__)
+            last_error = FetchError(f"{type(e).__name__}: {e}")
+        else:
+            metrics.observe("g2f_upstream_request_seconds", time.perf_counter() - started, method=method, status=str(response.status_code))
+            metrics.inc("g2f_upstream_response_bytes_total", len(response.content), method=method)
+            if response.status_code in RETRY_STATUS_CODES:
+                retry_after = response.headers.get("Retry-After")
+                last_error = FetchError(f"HTTP {response.status_code} from {url}", status_code=response.status_code)
+            elif response.status_code >= 400:
+                # Client errors will not get better by retrying
+                metrics.inc("g2f_upstream_errors_total", reason=str(response.status_code))
+                raise FetchError(f"HTTP {response.status_code} from {url}", status_code=response.status_code, transient=False)
+            else:
+                try:
+                    with metrics.timer("json_parse"):
+                        return response.json()
+                except ValueError as e:
+                    metrics.inc("g2f_upstream_errors_total", reason="invalid_json")
+                    raise FetchError(f"Invalid JSON from {url}: {e}", transient=False)
+
+        if attempt < config.MAX_RETRIES:
+            metrics.inc("g2f_upstream_retries_total", reason=str(last_error.status_code or "connection"))
+            time.sleep(_backoff_delay(attempt, retry_after))
+
+    metrics.inc("g2f_upstream_errors_total", reason=str(last_error.status_code or "connection"))
+    raise last_error
+
+
+def run_parallel(func, items, max_workers=None):
+    # Apply `func` to every item on a thread pool. Returns (result, error) pairs in input order;
+    # exceptions are captured per item instead of aborting the whole run.
+    items = list(items)
+    max_workers = max_workers or config.MAX_CONCURRENCY
+
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    if len(items) <= 1 or max_workers <= 1:
+        return [call(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(call, items))
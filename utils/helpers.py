@@ -1,82 +1,356 @@
-import requests
+import time
+from dataclasses import replace
+
+from utils import config, metrics
+from utils.cache import get_cache, normalize_fields
+from utils.fetch import FetchError, request_json, run_parallel
+from utils.local_index import get_local_index
+from utils.resolve import ID_TYPE_SCOPES, SYMBOL_LIKE_ID_TYPES, resolve_identifiers
+from utils.models import ANNOTATION_SECTIONS, GO_CATEGORIES, GOAnnotation, GeneRecord, PathwayRef
+
+MYGENE_QUERY_URL = config.MYGENE_URL
+DEFAULT_FIELDS = "symbol,name,summary,entrezgene,uniprot,pathway,go,pharmgkb,taxid"
+# Field profiles for the initial lookup. The light ones leave out the GO and pathway
+# sections (ANNOTATION_SECTIONS); load_sections() fills those in later, in batch.
+FIELD_PROFILES = {
+    "minimal": "symbol,name,entrezgene,taxid",
+    "standard": "symbol,name,summary,entrezgene,uniprot,pharmgkb,taxid",
+    "full": DEFAULT_FIELDS,
+}
+# Identifier types matched by the batch endpoint (symbols, aliases and common IDs)
+DEFAULT_SCOPES = "symbol,alias,entrezgene,ensembl.gene,uniprot"
+# mygene.info accepts at most 1000 IDs per POST query
+MAX_BATCH_SIZE = 1000
+# Cache scope marker for free-text single-gene searches (as opposed to batch scopes)
+FREE_TEXT_SCOPE = "q"
+
+
+def _as_list(value):
+    # mygene.info returns a single dict instead of a one-element list for single entries
+    if isinstance(value, list):
+        return value
+    return [value] if value is not None else []
+
+
+def profile_fields(profile=None):
+    # Field list for a profile name (default: config.FIELD_PROFILE)
+    profile = profile or config.FIELD_PROFILE
+    if profile not in FIELD_PROFILES:
+        raise ValueError(f"Unknown field profile '{profile}', expected one of: {', '.join(FIELD_PROFILES)}")
+    return FIELD_PROFILES[profile]
+
+
+def _missing_sections(fields):
+    requested = set(fields.split(","))
+    return [s for s in ANNOTATION_SECTIONS if s not in requested]
+
+
+def _parse_hit(hit, missing_sections=()):
+    # Parse UniProt Swiss-Prot entry properly
+    swiss_prot = hit.get("uniprot", {}).get("Swiss-Prot") if isinstance(hit.get("uniprot"), dict) else None
+    if isinstance(swiss_prot, list):
+        swiss_prot = ', '.join(swiss_prot)
+
+    # Pathway database names, IDs and names
+    pathways = []
+    pathway_data = hit.get("pathway")
+    if isinstance(pathway_data, dict):
+        for db, entries in pathway_data.items():
+            for p in _as_list(entries):
+                if isinstance(p, dict) and "id" in p:
+                    pathways.append(PathwayRef(db=db, pathway_id=str(p["id"]), name=p.get("name")))
+
+    # GO annotations with category, ID, term name and evidence code
+    go_terms = []
+    go_data = hit.get("go") or {}
+    for category_key, category_display_name in GO_CATEGORIES.items():
+        for term_obj in _as_list(go_data.get(category_key)):
+            if isinstance(term_obj, dict) and "term" in term_obj:
+                go_terms.append(GOAnnotation(category=category_display_name, go_id=term_obj.get("id"),
+                                             term=term_obj["term"], evidence=term_obj.get("evidence")))
+
+    return GeneRecord(
+        gene_symbol=hit.get("symbol"),
+        name=hit.get("name"),
+        function=hit.get("summary", "Function info not available."),
+        pharmgkb=hit.get("pharmgkb", "Not available"),
+        entrez_id=hit.get("entrezgene"),
+        uniprot=swiss_prot,
+        taxid=hit.get("taxid"),
+        go=go_terms,
+        pathways=pathways,
+        missing_sections=list(missing_sections)
+    )
+
+
+def _record_from_cache(cached, missing_sections=()):
+    # Entries written by older versions hold a differently shaped record; the raw hit is
+    # always stored, so re-parse it rather than going back to the network
+    record = cached["record"]
+    if isinstance(record, dict) and isinstance(record.get("go"), list):
+        return GeneRecord.from_dict(record)
+    return _parse_hit(cached["hit"], missing_sections) if cached["hit"] else None
+
+
+def _cache_get_many(cache, queries, species, fields, scopes):
+    # Cached entries for `fields`; a complete record cached earlier serves a lighter
+    # profile just as well, so fall back to those before going to the network
+    found = cache.get_many(queries, species, fields, scopes)
+    if normalize_fields(fields) != normalize_fields(DEFAULT_FIELDS):
+        rest = [q for q in queries if q not in found]
+        if rest:
+            found.update(cache.get_many(rest, species, DEFAULT_FIELDS, scopes))
+    return found
+
+
+def search_gene_function(gene_symbol, use_cache=True, fields=None):
+    # Returns a GeneRecord for the best hit, or None if nothing matched (or the input is an
+    # ambiguous alias - see utils.resolve.resolve_identifiers to report the candidates).
+    # Raises FetchError if mygene.info could not be reached after retries
+    # (or, in offline mode, if the gene is not cached).
+    # `fields` defaults to the configured field profile; see load_sections for the rest.
+    if config.BACKEND == "local":
+        return get_local_index().search_genes_batch([gene_symbol])[0]["result"]
+
+    # Recognised IDs and locally resolved symbols become fielded queries instead of free text
+    with metrics.timer("resolve"):
+        resolution = resolve_identifiers([gene_symbol])[0]
+    if resolution["status"] == "ambiguous":
+        return None
+    fields = fields or profile_fields()
+    query = gene_symbol
+    upstream = _upstream_query(resolution, None)
+    if upstream is not None and upstream[0] is not None:
+        query = f"{upstream[0]}:{upstream[1]}"
+
+    cache = get_cache() if use_cache else None
+    if cache is not None:
+        with metrics.timer("cache_read"):
+            cached = _cache_get_many(cache, [query], "human", fields, FREE_TEXT_SCOPE).get(query)
+        metrics.inc("g2f_cache_lookups_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            result = _record_from_cache(cached, _missing_sections(fields))
+            if result is not None:
+                result.input_gene = gene_symbol
+            return result
+    if config.OFFLINE:
+        raise FetchError(f"Offline mode: '{gene_symbol}' is not in the local cache", transient=False)
 
-def search_gene_function(gene_symbol):
-    url = "https://mygene.info/v3/query"
     params = {
-        "q": gene_symbol,
+        "q": query,
         "species": "human",
-        "fields": "symbol,name,summary,entrezgene,uniprot,pathway,go,pharmgkb,taxid"
+        "fields": fields
     }
 
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        if not data.get("hits"):
-            return None
-
-        hit = data["hits"][0]
-
-        # Parse UniProt Swiss-Prot entry properly
-        swiss_prot = hit.get("uniprot", {}).get("Swiss-Prot") if isinstance(hit.get("uniprot"), dict) else None
-        if isinstance(swiss_prot, list):
-            swiss_prot = ', '.join(swiss_prot)
-
-        # Flatten pathway database names and IDs
-        pathway_data = hit.get("pathway")
-        pathway_info_list = []
-        if isinstance(pathway_data, dict):
-            for db, pathways in pathway_data.items():
-                if isinstance(pathways, list):
-                    for p in pathways:
-                        if isinstance(p, dict) and "id" in p:
-                            pathway_info_list.append(f"{db}:{p['id']}")
-                elif isinstance(pathways, dict) and "id" in pathways:
-                    pathway_info_list.append(f"{db}:{pathways['id']}")
-        
-        pathway_info = "; ".join(pathway_info_list) if pathway_info_list else "Not available"
-
-
-        # --- MODIFICATION START: Flatten GO terms to include category and term name ---
-        go_data = hit.get("go", {})
-        flattened_go_terms = []
-        # Mapping from MyGene.info API keys to display names
-        go_category_mapping = {
-            "BP": "Biological Process",
-            "CC": "Cellular Component",
-            "MF": "Molecular Function"
-        }
+    data = request_json("GET", MYGENE_QUERY_URL, params=params)
 
-        for category_key, category_display_name in go_category_mapping.items():
-            if category_key in go_data:
-                terms_list_or_dict = go_data[category_key]
-                if isinstance(terms_list_or_dict, list):
-                    for term_obj in terms_list_or_dict:
-                        if isinstance(term_obj, dict) and "term" in term_obj:
-                            # Store as "CategoryDisplayName:Term Name" for easier parsing in main.py
-                            flattened_go_terms.append(f"{category_display_name}:{term_obj['term']}")
-                elif isinstance(terms_list_or_dict, dict) and "term" in terms_list_or_dict:
-                    # Handle cases where a category might have a single term returned as a dict
-                    flattened_go_terms.append(f"{category_display_name}:{terms_list_or_dict['term']}")
-
-        go_terms_string = "; ".join(flattened_go_terms) if flattened_go_terms else "Not available"
-        # --- MODIFICATION END ---
-
-        result = {
-            "gene_symbol": hit.get("symbol"),
-            "name": hit.get("name"),
-            "function": hit.get("summary", "Function info not available."),
-            "pathway": pathway_info,
-            "go_terms": go_terms_string, # Now it's a string like "Biological Process:term1; Cellular Component:termA"
-            "pharmgkb": hit.get("pharmgkb", "Not available"),
-            "entrez_id": hit.get("entrezgene"),
-            "uniprot": swiss_prot,
-            "taxid": hit.get("taxid")
+    hits = data.get("hits") or []
+    hit = hits[0] if hits else None
+    with metrics.timer("parse_hits"):
+        result = _parse_hit(hit, _missing_sections(fields)) if hit else None
+    if cache is not None:
+        with metrics.timer("cache_write"):
+            cache.put(query, hit, result.to_dict() if result else None, len(hits), "human", fields, FREE_TEXT_SCOPE)
+
+    if result is not None:
+        result.input_gene = gene_symbol
+    return result
+
+
+def _lookup_queries(queries, species, fields, scopes, chunk_size, max_workers, cache):
+    # Resolve distinct upstream queries for one scope: cache first, then chunked POSTs.
+    # Returns {query: (record, hit_count, cached, error)}; in offline mode uncached
+    # queries are simply absent.
+    missing_sections = _missing_sections(fields)
+    lookups = {}
+    if cache is not None:
+        with metrics.timer("cache_read"):
+            for query, cached in _cache_get_many(cache, queries, species, fields, scopes).items():
+                lookups[query] = (_record_from_cache(cached, missing_sections), cached["hit_count"], True, None)
+        metrics.inc("g2f_cache_lookups_total", len(lookups), result="hit")
+        metrics.inc("g2f_cache_lookups_total", len(queries) - len(lookups), result="miss")
+
+    to_fetch = [q for q in queries if q not in lookups]
+    if config.OFFLINE:
+        to_fetch = []
+    chunks = [to_fetch[i:i + chunk_size] for i in range(0, len(to_fetch), chunk_size)]
+
+    def fetch_chunk(chunk):
+        data = {
+            "q": ",".join(chunk),
+            "scopes": scopes,
+            "fields": fields,
+            "species": species
         }
+        return request_json("POST", MYGENE_QUERY_URL, data=data)
 
-        return result
+    for chunk, (hits, error) in zip(chunks, run_parallel(fetch_chunk, chunks, max_workers=max_workers)):
+        if error is not None:
+            for query in chunk:
+                lookups[query] = (None, 0, False, str(error))
+            continue
 
-    except Exception as e:
-        print(f"Error fetching gene info: {e}")
-        return None
+        # Hits come back in query order, with one entry per match (or a "notfound" marker)
+        parse_started = time.perf_counter()
+        hits_by_query = {}
+        for hit in hits:
+            query = hit.get("query")
+            if query is None or hit.get("notfound"):
+                continue
+            hits_by_query.setdefault(query, []).append(hit)
+
+        new_entries = []
+        for query in chunk:
+            query_hits = hits_by_query.get(query, [])
+            best_hit = query_hits[0] if query_hits else None
+            record = _parse_hit(best_hit, missing_sections) if best_hit else None
+            lookups[query] = (record, len(query_hits), False, None)
+            new_entries.append((query, best_hit, record.to_dict() if record else None, len(query_hits)))
+        metrics.record_stage("parse_hits", time.perf_counter() - parse_started)
+        if cache is not None:
+            with metrics.timer("cache_write"):
+                cache.put_many(new_entries, species, fields, scopes)
+
+    return lookups
+
+
+def _upstream_query(resolution, scopes):
+    # (scope, query string) to send for a resolved/unresolved input, or None if ambiguous.
+    # scopes=None stands for a free-text query (single lookups).
+    if resolution["status"] == "resolved":
+        return "symbol", resolution["canonical"]
+    if resolution["status"] == "unresolved" and resolution["query_key"]:
+        id_type, key = resolution["query_key"]
+        if id_type in SYMBOL_LIKE_ID_TYPES:
+            # Only the ID pattern matched, and real symbols (P2RY12, B3GAT1) match it too:
+            # keep the symbol scopes, or free text, and make sure the ID scope is among them
+            id_scope = ID_TYPE_SCOPES[id_type]
+            if scopes is None or id_scope in scopes.split(","):
+                return scopes, key
+            return f"{scopes},{id_scope}", key
+        return ID_TYPE_SCOPES.get(id_type, scopes), key
+    return None
+
+
+def search_genes_batch(symbols, species="human", fields=None, scopes=DEFAULT_SCOPES, chunk_size=MAX_BATCH_SIZE, max_workers=None, use_cache=True):
+    # Look up many genes with chunked POSTs to mygene.info's querymany endpoint.
+    # Inputs are first classified and resolved locally (utils.resolve): aliases, previous
+    # symbols and cross-reference IDs that map to the same approved symbol, and case or
+    # version variants of the same ID, are sent upstream only once, with a matching scope.
+    # Cached genes are served locally; the rest are fetched concurrently through the
+    # shared, rate-limited session and written back to the cache.
+    # `fields` defaults to the configured field profile (see FIELD_PROFILES); records from a
+    # light profile list what they lack in missing_sections, for load_sections().
+    # Returns one entry per input symbol, in input order:
+    #   {"input_gene", "status", "hit_count", "result" (GeneRecord or None), "error", "cached",
+    #    "id_type", "resolved_as", "candidates"}
+    # status is one of:
+    #   "found" / "notfound"
+    #   "duplicate" - the query matched several genes; the best-scoring hit is kept as "result"
+    #   "ambiguous" - the input is an alias of several approved symbols (see "candidates");
+    #                 nothing is looked up rather than guessing
+    #   "error"     - the chunk failed after retries; the gene may well exist, so it is not "notfound"
+    #   "uncached"  - offline mode and the gene is not in the local cache
+    chunk_size = max(1, min(chunk_size, MAX_BATCH_SIZE))
+
+    # With the local backend everything is answered from the on-disk index
+    if config.BACKEND == "local":
+        return get_local_index().search_genes_batch(symbols)
+
+    fields = fields or profile_fields()
+    inputs = [str(s).strip() for s in symbols]
+    with metrics.timer("resolve"):
+        resolutions = resolve_identifiers(inputs)
+    upstream = [_upstream_query(r, scopes) for r in resolutions]
+
+    # Send each distinct query once per scope, but report on every input position
+    queries_by_scope = {}
+    for item in upstream:
+        if item is not None:
+            queries_by_scope.setdefault(item[0], {})[item[1]] = None
+
+    cache = get_cache() if use_cache else None
+    lookups = {}
+    for scope, queries in queries_by_scope.items():
+        for query, lookup in _lookup_queries(list(queries), species, fields, scope, chunk_size, max_workers, cache).items():
+            lookups[(scope, query)] = lookup
+
+    batch_results = []
+    for query, resolution, item in zip(inputs, resolutions, upstream):
+        record, hit_count, cached, error = lookups.get(item, (None, 0, False, None))
+        if resolution["status"] == "ambiguous":
+            status = "ambiguous"
+        elif error is not None:
+            status = "error"
+        elif item is not None and item not in lookups:
+            status = "uncached" if config.OFFLINE else "notfound"
+        elif hit_count == 0:
+            status = "notfound"
+        elif hit_count > 1:
+            status = "duplicate"
+        else:
+            status = "found"
+
+        batch_results.append({
+            "input_gene": query,
+            "status": status,
+            "hit_count": hit_count,
+            "result": replace(record, input_gene=query) if record else None,
+            "error": error,
+            "cached": cached,
+            "id_type": resolution["id_type"],
+            "resolved_as": resolution["canonical"],
+            "candidates": resolution["candidates"] if resolution["status"] == "ambiguous" else []
+        })
+        metrics.inc("g2f_genes_total", status=status)
+
+    return batch_results
+
+
+def load_sections(records, sections=ANNOTATION_SECTIONS, species="human", chunk_size=MAX_BATCH_SIZE, max_workers=None, use_cache=True):
+    # Fetch the heavy sections a light field profile left out, for every record still
+    # missing them, with chunked batch queries keyed on Entrez ID (or symbol). Records are
+    # updated in place. Section-only results are cached under their own fields, so a
+    # section is never fetched twice. Returns the number of records completed; records
+    # whose lookup failed (or, offline, is not cached) keep their missing_sections.
+    groups = {}
+    completed = 0
+    for record in records:
+        if record is None or record.is_complete(sections):
+            continue
+        wanted = tuple(s for s in sections if s in record.missing_sections)
+        if record.entrez_id is not None:
+            scope, key = "entrezgene", str(record.entrez_id)
+        elif record.gene_symbol:
+            scope, key = "symbol", record.gene_symbol
+        else:
+            # Nothing to look the sections up by; settle them as empty rather than
+            # trying again on every call
+            if "go" in wanted:
+                record.go = []
+            if "pathway" in wanted:
+                record.pathways = []
+            record.missing_sections = [s for s in record.missing_sections if s not in wanted]
+            completed += 1
+            continue
+        # Batch copies of the same gene share one query
+        groups.setdefault((wanted, scope), {}).setdefault(key, []).append(record)
+
+    cache = get_cache() if use_cache else None
+    for (wanted, scope), by_key in groups.items():
+        with metrics.timer("load_sections"):
+            lookups = _lookup_queries(list(by_key), species, ",".join(wanted), scope, chunk_size, max_workers, cache)
+        for key, group in by_key.items():
+            lookup = lookups.get(key)
+            if lookup is None or lookup[3] is not None:
+                continue
+            section_record = lookup[0]
+            for record in group:
+                # Assign new lists: batch entries are shallow copies sharing the old ones
+                if "go" in wanted:
+                    record.go = list(section_record.go) if section_record else []
+                if "pathway" in wanted:
+                    record.pathways = list(section_record.pathways) if section_record else []
+                record.missing_sections = [s for s in record.missing_sections if s not in wanted]
+                completed += 1
+    return completed
@@ -0,0 +1,93 @@
+import io
+
+import pandas as pd
+
+# Rows read per chunk; peak memory of the reader is bounded by this, not by the file size
+DEFAULT_CHUNK_ROWS = 10000
+SUPPORTED_EXTENSIONS = ("csv", "tsv", "xlsx")
+
+
+def _as_buffer(source):
+    # Accept raw bytes, a path or an already-open binary file object
+    # (paths are passed through; pandas and openpyxl open and close them themselves)
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if isinstance(source, str):
+        return source
+    source.seek(0)
+    return source
+
+
+def file_extension(filename):
+    return filename.rsplit(".", 1)[-1].lower()
+
+
+def read_columns(source, ext):
+    # Header names only, without reading the body of the file
+    buffer = _as_buffer(source)
+    if ext == "xlsx":
+        from openpyxl import load_workbook
+        workbook = load_workbook(buffer, read_only=True, data_only=True)
+        try:
+            header = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        return [str(h) if h is not None else f"Column {i + 1}" for i, h in enumerate(header)]
+    sep = "\t" if ext == "tsv" else ","
+    return list(pd.read_csv(buffer, sep=sep, nrows=0).columns)
+
+
+def read_preview(source, ext, column, rows=10):
+    # First few values of the gene column, for display
+    values = []
+    for chunk in _iter_column_chunks(source, ext, column, chunk_rows=rows):
+        values.extend(chunk)
+        break
+    return pd.DataFrame({column: values[:rows]})
+
+
+def _iter_column_chunks(source, ext, column, chunk_rows):
+    # Yield raw values of one column, chunk_rows at a time
+    buffer = _as_buffer(source)
+    if ext == "xlsx":
+        from openpyxl import load_workbook
+        workbook = load_workbook(buffer, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, ())
+            names = [str(h) if h is not None else f"Column {i + 1}" for i, h in enumerate(header)]
+            index = names.index(column)
+            chunk = []
+            for row in rows:
+                chunk.append(row[index] if index < len(row) else None)
+                if len(chunk) >= chunk_rows:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        finally:
+            workbook.close()
+        return
+
+    sep = "\t" if ext == "tsv" else ","
+    reader = pd.read_csv(buffer, sep=sep, usecols=[column], dtype=str, chunksize=chunk_rows)
+    with reader:
+        for frame in reader:
+            yield frame[column].tolist()
+
+
+def iter_genes(source, ext, column, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # Stream distinct, stripped gene IDs from one column of a CSV/TSV/XLSX file, in file
+    # order. Only the set of IDs already seen is kept, so memory does not grow with the
+    # number of rows read.
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported file format: {ext}")
+    seen = set()
+    for chunk in _iter_column_chunks(source, ext, column, chunk_rows):
+        for value in chunk:
+            if value is None or (isinstance(value, float) and value != value):
+                continue
+            gene = str(value).strip()
+            if gene and gene not in seen:
+                seen.add(gene)
+                yield gene
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils import config, metrics
+from utils.helpers import search_genes_batch
+from utils.models import GeneRecord
+
+# Entries that are not final answers: transient failures, and genes skipped because they
+# were not cached while offline. They are never checkpointed and are looked up again on start().
+UNSETTLED_STATUSES = ("error", "uncached")
+
+
+def content_hash(data):
+    # Stable job key for an uploaded file's bytes
+    return hashlib.sha256(data).hexdigest()
+
+
+def _checkpoint_expired(path):
+    # Checkpoints hold annotations like the cache does, so they age out with it
+    # (CACHE_TTL_DAYS, 0 = never); the file's mtime is its last write
+    ttl_seconds = config.CACHE_TTL_DAYS * 86400
+    return ttl_seconds > 0 and time.time() - os.path.getmtime(path) >= ttl_seconds
+
+
+def remove_expired_checkpoints(jobs_dir=None):
+    # Delete checkpoints older than the cache TTL; returns how many were removed
+    jobs_dir = jobs_dir or config.JOBS_DIR
+    if not os.path.isdir(jobs_dir):
+        return 0
+    removed = 0
+    for name in os.listdir(jobs_dir):
+        path = os.path.join(jobs_dir, name)
+        try:
+            if name.endswith(".jsonl") and _checkpoint_expired(path):
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+class AnnotationJob:
+    # Annotates a gene list on a background thread, checkpointing every completed chunk
+    # to <JOBS_DIR>/<job_id>.jsonl. A job started again with the same id (after a crash
+    # or server restart) skips the genes already in its checkpoint.
+    # Genes that failed transiently are not checkpointed, so a resumed job retries them;
+    # start() on a finished job with failures retries just those genes.
+    #
+    # `genes` is either a list or a zero-argument callable returning an iterable (e.g.
+    # utils.ingest.iter_genes over an upload). A callable is consumed as a stream: lookups
+    # start with the first chunk, and it is called again when the job is resumed.
+
+    def __init__(self, job_id, genes, chunk_size=None, jobs_dir=None, max_workers=None):
+        self.job_id = job_id
+        self.max_workers = max_workers
+        self._source = genes
+        self._streaming = callable(genes)
+        self.genes = [] if self._streaming else list(dict.fromkeys(genes))
+        self.loading = self._streaming
+        self.chunk_size = chunk_size or config.JOB_CHUNK_SIZE
+        self.jobs_dir = jobs_dir or config.JOBS_DIR
+        self.checkpoint_path = os.path.join(self.jobs_dir, f"{job_id}.jsonl")
+
+        self.status = "pending"  # pending / running / done / failed
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._entries = {}
+        self._done = 0
+        self._fetched_this_run = 0
+        self._resumed = 0
+        self._cache_hits = 0
+        # Bumped whenever results change, so callers can tell when to rebuild their views
+        self.version = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        if _checkpoint_expired(self.checkpoint_path):
+            # Too old to trust; annotate again (through the cache) rather than replay it
+            os.remove(self.checkpoint_path)
+            return
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if entry.get("result") is not None:
+                        entry["result"] = GeneRecord.from_dict(entry["result"])
+                    if entry.get("status") in UNSETTLED_STATUSES:
+                        # Written by older versions, which checkpointed offline skips
+                        continue
+                except (ValueError, TypeError):
+                    # A crash mid-write can leave a truncated last line, and checkpoints from
+                    # older versions hold a different record shape; those genes are redone
+                    continue
+                if entry.get("input_gene"):
+                    self._entries[entry["input_gene"]] = entry
+
+    def _checkpoint(self, entries):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        with metrics.timer("checkpoint"), open(self.checkpoint_path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                row = dict(entry)
+                if row.get("result") is not None:
+                    row["result"] = row["result"].to_dict()
+                f.write(json.dumps(row) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start(self):
+        with self._lock:
+            if self.status == "running" or (self.status == "done" and not self._failed_count()):
+                return self
+            self.status = "running"
+            self.error = None
+            self.started_at = time.time()
+            self._done = 0
+            self._fetched_this_run = 0
+            self._resumed = 0
+            self._cache_hits = 0
+            # Genes that failed (or were skipped offline) last time are retried
+            self._entries = {g: e for g, e in self._entries.items() if e["status"] not in UNSETTLED_STATUSES}
+            self.version += 1
+            if self._streaming:
+                self.genes = []
+                self.loading = True
+            self._thread = threading.Thread(target=self._run, name=f"annotate-{self.job_id[:12]}", daemon=True)
+            self._thread.start()
+        return self
+
+    def _annotate(self, chunk, failed):
+        batch_results = search_genes_batch(chunk, max_workers=self.max_workers)
+        self._checkpoint([e for e in batch_results if e["status"] not in UNSETTLED_STATUSES])
+        with self._lock:
+            for entry in batch_results:
+                if entry["status"] == "error":
+                    failed[entry["input_gene"]] = entry
+                else:
+                    self._entries[entry["input_gene"]] = entry
+            self._done += len(chunk)
+            self._fetched_this_run += len(chunk)
+            self._cache_hits += sum(1 for e in batch_results if e.get("cached"))
+            self.version += 1
+
+    def _run(self):
+        failed = {}
+        try:
+            source = self._source() if self._streaming else list(self.genes)
+            seen = set()
+            pending = []
+            for gene in source:
+                if gene in seen:
+                    continue
+                seen.add(gene)
+                with self._lock:
+                    if self._streaming:
+                        self.genes.append(gene)
+                    if gene in self._entries:
+                        # Already in the checkpoint
+                        self._done += 1
+                        self._resumed += 1
+                        continue
+                pending.append(gene)
+                if len(pending) >= self.chunk_size:
+                    self._annotate(pending, failed)
+                    pending = []
+            with self._lock:
+                self.loading = False
+            if pending:
+                self._annotate(pending, failed)
+            with self._lock:
+                # Keep failures visible in the results; they are retried on the next start()
+                for gene, entry in failed.items():
+                    self._entries.setdefault(gene, entry)
+                self.version += 1
+                self.status = "done"
+                if self._streaming and not failed:
+                    # Nothing left to resume; let the source (and the upload it holds) go
+                    self._source = None
+        except Exception as e:
+            with self._lock:
+                self.status = "failed"
+                self.error = str(e)
+                self.loading = False
+        finally:
+            self.finished_at = time.time()
+
+    def wait(self, timeout=None):
+        # Block until the background thread finishes (for headless use)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self
+
+    def _failed_count(self):
+        return sum(1 for e in self._entries.values() if e["status"] == "error")
+
+    def progress(self):
+        # Snapshot of job progress: counts, fraction and ETA (seconds, None until measurable).
+        # While a streamed source is still being read ("loading"), total is the number of
+        # distinct genes seen so far.
+        with self._lock:
+            total = len(self.genes)
+            done = min(total, self._done) if self.status == "running" else sum(g in self._entries for g in self.genes)
+            eta = None
+            if self.status == "running" and not self.loading and self._fetched_this_run and self.started_at:
+                rate = self._fetched_this_run / max(time.time() - self.started_at, 1e-6)
+                eta = (total - done) / rate if rate else None
+            return {
+                "status": self.status,
+                "loading": self.loading,
+                "done": done,
+                "total": total,
+                "fraction": done / total if total else (0.0 if self.loading else 1.0),
+                "eta_seconds": eta,
+                "resumed": self._resumed,
+                "cache_hits": self._cache_hits,
+                "failed": self._failed_count(),
+                "version": self.version,
+                "error": self.error
+            }
+
+    def results(self):
+        # Batch entries (see search_genes_batch) completed so far, in input order
+        with self._lock:
+            return [self._entries[g] for g in self.genes if g in self._entries]
+
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _drop_old_jobs():
+    # Keep the JOBS_MAX_IN_MEMORY most recently used jobs; running ones are never dropped.
+    # A dropped job that is asked for again is rebuilt from its checkpoint.
+    excess = len(_jobs) - config.JOBS_MAX_IN_MEMORY
+    for job_id in [j for j, job in _jobs.items() if job.status != "running"][:max(0, excess)]:
+        del _jobs[job_id]
+
+
+def get_or_start_job(job_id, genes):
+    # Jobs are kept in memory (up to JOBS_MAX_IN_MEMORY), so Streamlit reruns and browser
+    # refreshes reattach to the running job instead of starting a new one.
+    # A failed job, or one that finished with failed genes, is left as is; call job.start() to retry it.
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            remove_expired_checkpoints()
+            job = AnnotationJob(job_id, genes)
+            _jobs[job_id] = job
+            _drop_old_jobs()
+        else:
+            _jobs.move_to_end(job_id)
+    if job.status == "pending":
+        job.start()
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,385 @@
+import gzip
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils import config
+from utils.models import GO_CATEGORIES, GOAnnotation, GeneRecord, PathwayRef
+from utils.resolve import resolve_identifiers
+
+# GAF aspect codes -> mygene.info GO category keys
+GAF_ASPECTS = {"P": "BP", "F": "MF", "C": "CC"}
+
+# Lookup token priorities: exact symbols/IDs win over synonyms when both match
+PRIORITY_PRIMARY = 0
+PRIORITY_SYNONYM = 1
+
+_SCHEMA = """
+CREATE TABLE genes (
+    gene_key INTEGER PRIMARY KEY,  -- NCBI GeneID
+    symbol TEXT,
+    name TEXT,
+    taxid INTEGER
+);
+CREATE TABLE gene_tokens (
+    token TEXT NOT NULL,           -- upper-cased symbol, synonym or cross-reference ID
+    gene_key INTEGER NOT NULL,
+    priority INTEGER NOT NULL
+);
+CREATE TABLE gene_uniprot (
+    gene_key INTEGER NOT NULL,
+    accession TEXT NOT NULL
+);
+CREATE TABLE terms (
+    term_key INTEGER PRIMARY KEY,
+    go_id TEXT NOT NULL UNIQUE,
+    term TEXT,
+    category TEXT                  -- BP / MF / CC
+);
+CREATE TABLE gene_go (
+    gene_key INTEGER NOT NULL,
+    term_key INTEGER NOT NULL,
+    evidence TEXT
+);
+CREATE TABLE pathways (
+    pathway_key INTEGER PRIMARY KEY,
+    db TEXT NOT NULL,
+    pathway_id TEXT NOT NULL,
+    name TEXT,
+    UNIQUE (db, pathway_id)
+);
+CREATE TABLE gene_pathway (
+    gene_key INTEGER NOT NULL,
+    pathway_key INTEGER NOT NULL
+);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def _open_text(path):
+    # Bulk dumps are usually distributed gzipped
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+# -----------------------
+# Index builder
+# -----------------------
+def _load_gene_info(conn, path, taxid):
+    # NCBI gene_info: tax_id, GeneID, Symbol, LocusTag, Synonyms, dbXrefs, chromosome,
+    # map_location, description, type_of_gene, Symbol_from_nomenclature_authority,
+    # Full_name_from_nomenclature_authority, ...
+    genes, tokens = [], []
+    with _open_text(path) as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 9 or (taxid and cols[0] != str(taxid)):
+                continue
+            gene_key = int(cols[1])
+            symbol = cols[2]
+            full_name = cols[11] if len(cols) > 11 and cols[11] != "-" else cols[8]
+            genes.append((gene_key, symbol, full_name, int(cols[0])))
+
+            tokens.append((symbol.upper(), gene_key, PRIORITY_PRIMARY))
+            tokens.append((str(gene_key), gene_key, PRIORITY_PRIMARY))
+            if cols[4] != "-":
+                tokens.extend((s.upper(), gene_key, PRIORITY_SYNONYM) for s in cols[4].split("|"))
+            if cols[5] != "-":
+                for xref in cols[5].split("|"):
+                    db, _, value = xref.partition(":")
+                    if db in ("Ensembl", "HGNC", "MIM"):
+                        # HGNC xrefs look like "HGNC:HGNC:11998"
+                        tokens.append((value.upper(), gene_key, PRIORITY_PRIMARY))
+    conn.executemany("INSERT OR REPLACE INTO genes VALUES (?, ?, ?, ?)", genes)
+    conn.executemany("INSERT INTO gene_tokens VALUES (?, ?, ?)", tokens)
+    return len(genes)
+
+
+def _load_uniprot_mapping(conn, path, known_genes):
+    # Either UniProt idmapping.dat (accession, id_type, id) or idmapping_selected.tab
+    # (accession, entry name, GeneID, ...). Only accession -> GeneID pairs are used.
+    pairs = []
+    with _open_text(path) as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) == 3:
+                if cols[1] != "GeneID":
+                    continue
+                gene_ids = [cols[2]]
+            elif len(cols) > 3:
+                gene_ids = [g.strip() for g in cols[2].split(";") if g.strip()]
+            else:
+                continue
+            for gene_id in gene_ids:
+                if gene_id.isdigit() and int(gene_id) in known_genes:
+                    pairs.append((int(gene_id), cols[0]))
+    conn.executemany("INSERT INTO gene_uniprot VALUES (?, ?)", pairs)
+    conn.executemany("INSERT INTO gene_tokens VALUES (?, ?, ?)",
+                     [(acc.upper(), gene_key, PRIORITY_PRIMARY) for gene_key, acc in pairs])
+    return {acc: gene_key for gene_key, acc in pairs}
+
+
+def _load_obo(path):
+    # GO term names and namespaces from go-basic.obo
+    names = {}
+    namespaces = {"biological_process": "BP", "molecular_function": "MF", "cellular_component": "CC"}
+    current = {}
+    with _open_text(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                if current.get("id"):
+                    names[current["id"]] = (current.get("name"), current.get("namespace"))
+                current = {} if line == "[Term]" else {"skip": True}
+            elif ": " in line and not current.get("skip"):
+                key, value = line.split(": ", 1)
+                if key == "id":
+                    current["id"] = value
+                elif key == "name":
+                    current["name"] = value
+                elif key == "namespace":
+                    current["namespace"] = namespaces.get(value)
+        if current.get("id"):
+            names[current["id"]] = (current.get("name"), current.get("namespace"))
+    return names
+
+
+def _load_gaf(conn, path, accession_to_gene, symbol_to_gene, term_keys, term_names):
+    # GO Annotation File 2.x: DB, DB_Object_ID, DB_Object_Symbol, Qualifier, GO_ID,
+    # DB_Reference, Evidence, With, Aspect, ...
+    rows = set()
+    new_terms = []
+    with _open_text(path) as f:
+        for line in f:
+            if line.startswith("!"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 9 or "NOT" in cols[3].split("|"):
+                continue
+            gene_key = accession_to_gene.get(cols[1]) or symbol_to_gene.get(cols[2].upper())
+            if gene_key is None:
+                continue
+            go_id = cols[4]
+            term_key = term_keys.get(go_id)
+            if term_key is None:
+                term_key = len(term_keys) + 1
+                term_keys[go_id] = term_key
+                name, namespace = term_names.get(go_id, (None, None))
+                new_terms.append((term_key, go_id, name or go_id, namespace or GAF_ASPECTS.get(cols[8])))
+            rows.add((gene_key, term_key, cols[6]))
+    conn.executemany("INSERT INTO terms VALUES (?, ?, ?, ?)", new_terms)
+    conn.executemany("INSERT INTO gene_go VALUES (?, ?, ?)", sorted(rows))
+    return len(rows)
+
+
+def _load_pathways(conn, db, path, symbol_to_gene, pathway_keys, species):
+    # Pathway membership tables. Two layouts are accepted:
+    #   Reactome NCBI2Reactome: GeneID, pathway ID, URL, name, evidence, species (no header)
+    #   generic TSV:            gene (GeneID or symbol), pathway ID, pathway name
+    rows = set()
+    new_pathways = []
+    with _open_text(path) as f:
+        for line in f:
+            if line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) >= 6:
+                if species and cols[5] != species:
+                    continue
+                gene, pathway_id, name = cols[0], cols[1], cols[3]
+            elif len(cols) >= 2:
+                gene, pathway_id = cols[0], cols[1]
+                name = cols[2] if len(cols) > 2 else None
+            else:
+                continue
+            gene_key = int(gene) if gene.isdigit() else symbol_to_gene.get(gene.upper())
+            if gene_key is None:
+                continue
+            pathway_key = pathway_keys.get((db, pathway_id))
+            if pathway_key is None:
+                pathway_key = len(pathway_keys) + 1
+                pathway_keys[(db, pathway_id)] = pathway_key
+                new_pathways.append((pathway_key, db, pathway_id, name))
+            rows.add((gene_key, pathway_key))
+    conn.executemany("INSERT INTO pathways VALUES (?, ?, ?, ?)", new_pathways)
+    conn.executemany("INSERT INTO gene_pathway VALUES (?, ?)", sorted(rows))
+    return len(rows)
+
+
+def build_index(output_path, gene_info, gaf_files=(), obo=None, uniprot_mapping=None,
+                pathway_tables=(), taxid=9606, species="Homo sapiens"):
+    # Compile local bulk files into a SQLite index with integer-coded genes, terms and pathways.
+    # pathway_tables is a list of (db, path) pairs, e.g. [("reactome", "NCBI2Reactome.txt")].
+    # Returns a dict of row counts.
+    tmp_path = output_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(_SCHEMA)
+
+    counts = {"genes": _load_gene_info(conn, gene_info, taxid)}
+    known_genes = {row[0] for row in conn.execute("SELECT gene_key FROM genes")}
+    symbol_to_gene = dict(conn.execute(
+        "SELECT token, gene_key FROM gene_tokens WHERE priority = ? GROUP BY token HAVING COUNT(*) = 1",
+        (PRIORITY_PRIMARY,)))
+
+    accession_to_gene = _load_uniprot_mapping(conn, uniprot_mapping, known_genes) if uniprot_mapping else {}
+    counts["uniprot"] = len(accession_to_gene)
+
+    term_names = _load_obo(obo) if obo else {}
+    term_keys = {}
+    counts["go_annotations"] = sum(
+        _load_gaf(conn, path, accession_to_gene, symbol_to_gene, term_keys, term_names) for path in gaf_files)
+
+    pathway_keys = {}
+    counts["pathway_memberships"] = sum(
+        _load_pathways(conn, db, path, symbol_to_gene, pathway_keys, species) for db, path in pathway_tables)
+
+    conn.executescript("""
+        CREATE INDEX idx_gene_tokens ON gene_tokens(token);
+        CREATE INDEX idx_gene_go ON gene_go(gene_key);
+        CREATE INDEX idx_gene_pathway ON gene_pathway(gene_key);
+        CREATE INDEX idx_gene_uniprot ON gene_uniprot(gene_key);
+    """)
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in counts.items()] + [("taxid", str(taxid))])
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, output_path)
+    return counts
+
+
+# -----------------------
+# Lookup backend
+# -----------------------
+def normalize_token(query):
+    token = str(query).strip().upper()
+    # Versioned Ensembl IDs (ENSG00000141510.17) resolve like the unversioned ID
+    if token.startswith("ENS") and "." in token:
+        token = token.split(".", 1)[0]
+    return token
+
+
+class LocalIndex:
+    # In-memory view of an index built by build_index. Loading takes a moment; after that,
+    # lookups are dict probes plus array slices, with no SQL per gene.
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Local annotation index not found: {path}")
+        self.path = path
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            self._load(conn)
+        finally:
+            conn.close()
+
+    def _load(self, conn):
+        # token -> [gene_key, ...] holding only the best-priority matches
+        self._tokens = {}
+        best_priority = {}
+        for token, gene_key, priority in conn.execute(
+                "SELECT DISTINCT token, gene_key, priority FROM gene_tokens ORDER BY priority, gene_key"):
+            if best_priority.setdefault(token, priority) == priority:
+                self._tokens.setdefault(token, []).append(gene_key)
+
+        self._genes = {row[0]: row[1:] for row in conn.execute("SELECT gene_key, symbol, name, taxid FROM genes")}
+
+        self._uniprot = {}
+        for gene_key, accession in conn.execute("SELECT gene_key, accession FROM gene_uniprot"):
+            self._uniprot.setdefault(gene_key, []).append(accession)
+
+        # GO and pathway entries are built once, sorted by gene, with a gene_key -> (start, end)
+        # offset table, so a lookup is a dict probe and a list slice. The entry objects are
+        # shared between records and must not be mutated.
+        terms = pd.read_sql("SELECT term_key, go_id, term, category FROM terms", conn).set_index("term_key")
+        gene_go = pd.read_sql("SELECT gene_key, term_key, evidence FROM gene_go ORDER BY gene_key", conn)
+        self._go_offsets = self._offsets(gene_go["gene_key"].to_numpy())
+        self._go_entries = list(map(GOAnnotation,
+            terms["category"].map(GO_CATEGORIES).reindex(gene_go["term_key"]).tolist(),
+            terms["go_id"].reindex(gene_go["term_key"]).tolist(),
+            terms["term"].reindex(gene_go["term_key"]).tolist(),
+            gene_go["evidence"].tolist()))
+
+        pathways = pd.read_sql("SELECT pathway_key, db, pathway_id, name FROM pathways", conn).set_index("pathway_key")
+        gene_pathway = pd.read_sql("SELECT gene_key, pathway_key FROM gene_pathway ORDER BY gene_key", conn)
+        self._pw_offsets = self._offsets(gene_pathway["gene_key"].to_numpy())
+        self._pw_entries = list(map(PathwayRef,
+            pathways["db"].reindex(gene_pathway["pathway_key"]).tolist(),
+            pathways["pathway_id"].reindex(gene_pathway["pathway_key"]).tolist(),
+            pathways["name"].reindex(gene_pathway["pathway_key"]).tolist()))
+
+    @staticmethod
+    def _offsets(sorted_keys):
+        keys, starts, counts = np.unique(sorted_keys, return_index=True, return_counts=True)
+        return {int(k): (int(s), int(s + c)) for k, s, c in zip(keys, starts, counts)}
+
+    def resolve(self, query):
+        # Candidate gene keys for one input, best matches only
+        return self._tokens.get(normalize_token(query), [])
+
+    def record(self, gene_key):
+        symbol, name, taxid = self._genes[gene_key]
+        go_start, go_end = self._go_offsets.get(gene_key, (0, 0))
+        pw_start, pw_end = self._pw_offsets.get(gene_key, (0, 0))
+        return GeneRecord(
+            gene_symbol=symbol,
+            name=name,
+            entrez_id=gene_key,
+            uniprot=", ".join(self._uniprot[gene_key]) if gene_key in self._uniprot else None,
+            taxid=taxid,
+            go=self._go_entries[go_start:go_end],
+            pathways=self._pw_entries[pw_start:pw_end]
+        )
+
+    def search_genes_batch(self, symbols, alias_index=None):
+        # Same entry shape and statuses as utils.helpers.search_genes_batch. Inputs are first
+        # resolved the same way (utils.resolve). A token that names several genes equally well
+        # (e.g. a synonym shared by two genes) is reported "ambiguous" with its candidates,
+        # rather than answered with one of them.
+        inputs = [str(s).strip() for s in symbols]
+        batch_results = []
+        for query, resolution in zip(inputs, resolve_identifiers(inputs, alias_index=alias_index)):
+            candidates = resolution["candidates"] if resolution["status"] == "ambiguous" else []
+            gene_keys = []
+            if query and not candidates:
+                gene_keys = self.resolve(resolution["canonical"] or query)
+                if len(gene_keys) > 1:
+                    candidates = sorted({self._genes[k][0] or str(k) for k in gene_keys})
+            record = self.record(gene_keys[0]) if len(gene_keys) == 1 else None
+            if record is not None:
+                record.input_gene = query
+            batch_results.append({
+                "input_gene": query,
+                "status": "ambiguous" if candidates else ("found" if record is not None else "notfound"),
+                "hit_count": len(gene_keys),
+                "result": record,
+                "error": None,
+                "cached": False,
+                "id_type": resolution["id_type"],
+                "resolved_as": resolution["canonical"],
+                "candidates": candidates
+            })
+        return batch_results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_local_index():
+    # Process-wide index loaded from config.LOCAL_INDEX_PATH on first use
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LocalIndex(config.LOCAL_INDEX_PATH)
+        return _index
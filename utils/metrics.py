@@ -0,0 +1,220 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from utils import config
+
+# In-process performance metrics: per-stage timers, upstream latency histograms,
+# retry/error counters, cache hit/miss counts and payload byte counts.
+# Off unless G2F_METRICS=1 (or enable() is called); when off every call returns
+# straight away, and timer() hands back a shared no-op context manager.
+#
+#   with metrics.timer("parse_hits"):
+#       ...
+#   metrics.inc("g2f_cache_lookups_total", result="hit")
+#
+# Export with to_prometheus() (text exposition format) or to_json().
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Recent observations kept per histogram for percentile estimates in the diagnostics panel
+_RECENT_SAMPLES = 2048
+_NULL_TIMER = nullcontext()
+
+STAGE_METRIC = "g2f_stage_seconds"
+_HELP = {
+    STAGE_METRIC: "Wall time spent per pipeline stage",
+    "g2f_upstream_request_seconds": "Latency of individual HTTP attempts to mygene.info",
+    "g2f_upstream_response_bytes_total": "Response body bytes received from mygene.info",
+    "g2f_upstream_retries_total": "HTTP attempts that were retried, by reason",
+    "g2f_upstream_errors_total": "Requests that failed after all retries, by reason",
+    "g2f_cache_lookups_total": "Annotation cache lookups, by result",
+    "g2f_genes_total": "Genes annotated, by status",
+    "g2f_exports_total": "Result exports written, by kind",
+}
+
+_enabled = config.METRICS_ENABLED
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+class _Histogram:
+    __slots__ = ("buckets", "sum", "count", "recent")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=_RECENT_SAMPLES)
+
+    def observe(self, value):
+        i = 0
+        while i < len(LATENCY_BUCKETS) and value > LATENCY_BUCKETS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentile(self, q):
+        samples = sorted(self.recent)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def enabled():
+    return _enabled
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def inc(name, amount=1, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram()
+        histogram.observe(value)
+
+
+def record_stage(stage, seconds):
+    observe(STAGE_METRIC, seconds, stage=stage)
+
+
+class _StageTimer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.stage, time.perf_counter() - self.started)
+
+
+def timer(stage):
+    # Context manager timing one pipeline stage into g2f_stage_seconds{stage=...}
+    return _StageTimer(stage) if _enabled else _NULL_TIMER
+
+
+def snapshot():
+    # Plain-data copy of every metric:
+    #   {"counters": [{"name", "labels", "value"}],
+    #    "histograms": [{"name", "labels", "count", "sum", "p50", "p95", "buckets": {le: cumulative}}]}
+    with _lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+        histograms = []
+        for (name, labels), h in sorted(_histograms.items()):
+            cumulative, running = {}, 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), h.buckets):
+                running += count
+                cumulative[str(bound)] = running
+            histograms.append({"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum,
+                               "p50": h.percentile(50), "p95": h.percentile(95), "buckets": cumulative})
+    return {"counters": counters, "histograms": histograms}
+
+
+def cache_hit_ratio(snap=None):
+    snap = snap or snapshot()
+    lookups = {c["labels"].get("result"): c["value"] for c in snap["counters"] if c["name"] == "g2f_cache_lookups_total"}
+    total = lookups.get("hit", 0) + lookups.get("miss", 0)
+    return lookups.get("hit", 0) / total if total else None
+
+
+def to_json(indent=2):
+    snap = snapshot()
+    snap["cache_hit_ratio"] = cache_hit_ratio(snap)
+    snap["timestamp"] = time.time()
+    return json.dumps(snap, indent=indent)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def to_prometheus():
+    # Prometheus text exposition format (version 0.0.4)
+    snap = snapshot()
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for c in snap["counters"]:
+        describe(c["name"], "counter")
+        lines.append(f"{c['name']}{_format_labels(c['labels'])} {c['value']}")
+    for h in snap["histograms"]:
+        describe(h["name"], "histogram")
+        for bound, count in h["buckets"].items():
+            lines.append(f"{h['name']}_bucket{_format_labels(h['labels'], {'le': bound})} {count}")
+        lines.append(f"{h['name']}_sum{_format_labels(h['labels'])} {h['sum']}")
+        lines.append(f"{h['name']}_count{_format_labels(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_dump(path):
+    # JSON for *.json paths, Prometheus text format otherwise
+    text = to_json() if path.endswith(".json") else to_prometheus()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def summary_tables():
+    # DataFrames for the app's diagnostics panel: stage timings, upstream latency and counters
+    import pandas as pd
+    snap = snapshot()
+    stages = pd.DataFrame(
+        [(h["labels"].get("stage"), h["count"], h["sum"], h["sum"] / h["count"] * 1000, h["p95"] * 1000)
+         for h in snap["histograms"] if h["name"] == STAGE_METRIC],
+        columns=["Stage", "Calls", "Total (s)", "Mean (ms)", "p95 (ms)"])
+    upstream = pd.DataFrame(
+        [(h["labels"].get("method"), h["labels"].get("status"), h["count"], h["p50"] * 1000, h["p95"] * 1000)
+         for h in snap["histograms"] if h["name"] == "g2f_upstream_request_seconds"],
+        columns=["Method", "Status", "Attempts", "p50 (ms)", "p95 (ms)"])
+    counters = pd.DataFrame(
+        [(c["name"], ", ".join(f"{k}={v}" for k, v in c["labels"].items()), c["value"]) for c in snap["counters"]],
+        columns=["Metric", "Labels", "Value"])
+    return {
+        "Stages": stages.sort_values("Total (s)", ascending=False),
+        "Upstream requests": upstream,
+        "Counters": counters,
+    }
@@ -0,0 +1,122 @@
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from utils import metrics
+
+# Mapping from MyGene.info GO keys to display names
+GO_CATEGORIES = {
+    "BP": "Biological Process",
+    "CC": "Cellular Component",
+    "MF": "Molecular Function"
+}
+
+# Scalar, one-per-gene columns of the gene table
+GENE_COLUMNS = ["input_gene", "gene_symbol", "name", "function", "pharmgkb", "entrez_id", "uniprot", "taxid"]
+GO_COLUMNS = ["input_gene", "gene_symbol", "category", "go_id", "term", "evidence"]
+PATHWAY_COLUMNS = ["input_gene", "gene_symbol", "db", "pathway_id", "name"]
+# Heavy mygene.info fields that light field profiles leave out and load on demand
+ANNOTATION_SECTIONS = ("go", "pathway")
+
+
+@dataclass(slots=True)
+class GOAnnotation:
+    category: str  # display name, e.g. "Biological Process"
+    go_id: str
+    term: str
+    evidence: str = None
+
+
+@dataclass(slots=True)
+class PathwayRef:
+    db: str  # source database key as returned by mygene.info, e.g. "kegg"
+    pathway_id: str
+    name: str = None
+
+
+@dataclass(slots=True)
+class GeneRecord:
+    gene_symbol: str = None
+    name: str = None
+    function: str = "Function info not available."
+    pharmgkb: str = "Not available"
+    entrez_id: object = None
+    uniprot: str = None
+    taxid: object = None
+    go: list = field(default_factory=list)
+    pathways: list = field(default_factory=list)
+    input_gene: str = None
+    # ANNOTATION_SECTIONS not fetched yet (see utils.helpers.load_sections); empty when complete
+    missing_sections: list = field(default_factory=list)
+
+    def is_complete(self, sections=ANNOTATION_SECTIONS):
+        return not any(s in self.missing_sections for s in sections)
+
+    def to_dict(self):
+        # Plain JSON-serialisable form (used by the cache and job checkpoints)
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["go"] = [GOAnnotation(**g) for g in data.get("go") or []]
+        data["pathways"] = [PathwayRef(**p) for p in data.get("pathways") or []]
+        return cls(**data)
+
+
+def records_to_frames(records):
+    # Build the long-form result tables from a list of GeneRecords:
+    #   genes:    one row per gene (GENE_COLUMNS)
+    #   go:       one row per gene x GO annotation (GO_COLUMNS)
+    #   pathways: one row per gene x pathway (PATHWAY_COLUMNS)
+    with metrics.timer("build_frames"):
+        return _records_to_frames(records)
+
+
+def _records_to_frames(records):
+    genes = pd.DataFrame(
+        [(r.input_gene, r.gene_symbol, r.name, r.function, r.pharmgkb, r.entrez_id, r.uniprot, r.taxid) for r in records],
+        columns=GENE_COLUMNS)
+    go = pd.DataFrame(
+        [(r.input_gene, r.gene_symbol, g.category, g.go_id, g.term, g.evidence) for r in records for g in r.go],
+        columns=GO_COLUMNS)
+    pathways = pd.DataFrame(
+        [(r.input_gene, r.gene_symbol, p.db, p.pathway_id, p.name) for r in records for p in r.pathways],
+        columns=PATHWAY_COLUMNS)
+
+    # Low-cardinality columns are stored as categoricals to keep large tables compact
+    go["category"] = go["category"].astype("category")
+    go["evidence"] = go["evidence"].astype("category")
+    pathways["db"] = pathways["db"].astype("category")
+    return genes, go, pathways
+
+
+def join_by_gene(input_genes, labels, sep):
+    # labels joined per input gene, keeping row order within each gene. Equivalent to
+    # labels.groupby(input_genes).agg(sep.join), but the rows are grouped with one
+    # factorize and stable sort; only the str.join itself runs once per gene
+    codes, genes = pd.factorize(input_genes)
+    order = np.argsort(codes, kind="stable")
+    values = labels.to_numpy(dtype=object)[order]
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    return pd.Series([sep.join(group) for group in np.split(values, bounds)], index=genes)
+
+
+def flat_table(genes, go, pathways):
+    # One row per gene with GO terms as "Category:Term; ..." and pathways as "db:id; ...",
+    # for exports that need a single flat table
+    flat = genes.copy()
+    if go is not None and not go.empty:
+        go_labels = go["category"].astype(str) + ":" + go["term"].astype(str)
+        flat["go_terms"] = flat["input_gene"].map(join_by_gene(go["input_gene"], go_labels, "; "))
+    else:
+        flat["go_terms"] = None
+    if pathways is not None and not pathways.empty:
+        pathway_labels = pathways["db"].astype(str) + ":" + pathways["pathway_id"].astype(str)
+        flat["pathway"] = flat["input_gene"].map(join_by_gene(pathways["input_gene"], pathway_labels, "; "))
+    else:
+        flat["pathway"] = None
+    flat["go_terms"] = flat["go_terms"].fillna("Not available")
+    flat["pathway"] = flat["pathway"].fillna("Not available")
+    return flat
@@ -0,0 +1,150 @@
+import csv
+import gzip
+import re
+import threading
+
+from utils import config
+
+# Identifier classes, most specific first
+ENTREZ_RE = re.compile(r"^\d+$")
+ENSEMBL_RE = re.compile(r"^ENS[A-Z]*G\d{11}(\.\d+)?$", re.IGNORECASE)
+UNIPROT_RE = re.compile(r"^([OPQ][0-9][A-Z0-9]{3}[0-9]|[A-NR-Z][0-9]([A-Z][A-Z0-9]{2}[0-9]){1,2})(-\d+)?$", re.IGNORECASE)
+
+# mygene.info scope to use for each identifier class when nothing better is known locally
+ID_TYPE_SCOPES = {
+    "entrez": "entrezgene",
+    "ensembl": "ensembl.gene",
+    "uniprot": "uniprot",
+}
+# ID classes whose pattern also matches real gene symbols (P2RY12, B3GAT1, H2BC12 all look
+# like UniProt accessions): the alias index is consulted before the pattern is trusted, and
+# an input matched by the pattern alone is still looked up as a symbol too
+SYMBOL_LIKE_ID_TYPES = ("uniprot",)
+
+
+def classify(identifier):
+    # "entrez", "ensembl", "uniprot" or "symbol" (anything else, including aliases)
+    value = str(identifier).strip()
+    if ENTREZ_RE.match(value):
+        return "entrez"
+    if ENSEMBL_RE.match(value):
+        return "ensembl"
+    if UNIPROT_RE.match(value):
+        return "uniprot"
+    return "symbol"
+
+
+def normalize(identifier, id_type=None):
+    # Canonical spelling used for hashing: upper case, no Ensembl version or UniProt isoform suffix
+    value = str(identifier).strip().upper()
+    id_type = id_type or classify(value)
+    if id_type == "ensembl":
+        return value.split(".", 1)[0]
+    if id_type == "uniprot":
+        return value.split("-", 1)[0]
+    return value
+
+
+def _split_multi(value):
+    # HGNC multi-valued columns are "|"-separated and sometimes quoted
+    value = (value or "").strip().strip('"')
+    return [v.strip() for v in value.split("|") if v.strip()]
+
+
+class AliasIndex:
+    # In-memory hash index over an HGNC-style table with columns symbol, alias_symbol,
+    # prev_symbol, entrez_id, ensembl_gene_id and uniprot_ids. Every key maps to the set
+    # of approved symbols it can stand for.
+
+    def __init__(self, path):
+        self.path = path
+        self.approved = {}     # upper-cased approved symbol -> approved symbol
+        self.previous = {}     # upper-cased previous symbol -> {approved}
+        self.aliases = {}      # upper-cased alias -> {approved}
+        self.cross_refs = {}   # normalized Entrez/Ensembl/UniProt ID -> {approved}
+        self._load(path)
+
+    def _load(self, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f, delimiter="\t"):
+                symbol = (row.get("symbol") or "").strip()
+                if not symbol or row.get("status", "Approved") not in ("Approved", ""):
+                    continue
+                self.approved[symbol.upper()] = symbol
+                for prev in _split_multi(row.get("prev_symbol")):
+                    self.previous.setdefault(prev.upper(), set()).add(symbol)
+                for alias in _split_multi(row.get("alias_symbol")):
+                    self.aliases.setdefault(alias.upper(), set()).add(symbol)
+                for column, id_type in (("entrez_id", "entrez"), ("ensembl_gene_id", "ensembl"), ("uniprot_ids", "uniprot")):
+                    for value in _split_multi(row.get(column)):
+                        self.cross_refs.setdefault(normalize(value, id_type), set()).add(symbol)
+
+    def candidates(self, identifier, id_type):
+        # (match kind, sorted approved symbols) for one identifier
+        key = normalize(identifier, "symbol")
+        if id_type in SYMBOL_LIKE_ID_TYPES and key in self.approved:
+            return "symbol", [self.approved[key]]
+        if id_type != "symbol":
+            found = sorted(self.cross_refs.get(normalize(identifier, id_type), ()))
+            if found or id_type not in SYMBOL_LIKE_ID_TYPES:
+                return id_type, found
+        if key in self.approved:
+            return "symbol", [self.approved[key]]
+        # A previous symbol is a stronger signal than an alias, so it is tried first
+        for kind, table in (("previous", self.previous), ("alias", self.aliases)):
+            if key in table:
+                return kind, sorted(table[key])
+        return "unresolved", []
+
+
+def resolve_identifiers(identifiers, alias_index=None):
+    # Classify and resolve each input. Returns one dict per input, in order:
+    #   {"input", "id_type", "match", "status" ("resolved" / "ambiguous" / "unresolved"),
+    #    "canonical" (approved symbol or None), "candidates", "query_key"}
+    # query_key is what upstream lookups should be deduplicated on: inputs that resolve to
+    # the same approved symbol share it, unresolved ones fall back to their normalized form.
+    alias_index = alias_index if alias_index is not None else get_alias_index()
+    resolutions = []
+    for identifier in identifiers:
+        value = str(identifier).strip()
+        id_type = classify(value)
+        match, candidates = ("unresolved", [])
+        if alias_index is not None and value:
+            match, candidates = alias_index.candidates(value, id_type)
+            if match in ("symbol", "previous", "alias"):
+                # e.g. P2RY12: a known symbol that merely looks like a UniProt accession
+                id_type = "symbol"
+
+        if len(candidates) == 1:
+            status, canonical, query_key = "resolved", candidates[0], ("symbol", candidates[0].upper())
+        elif candidates:
+            status, canonical, query_key = "ambiguous", None, None
+        else:
+            status, canonical, query_key = "unresolved", None, (id_type, normalize(value, id_type)) if value else None
+
+        resolutions.append({
+            "input": value,
+            "id_type": id_type,
+            "match": match,
+            "status": status,
+            "canonical": canonical,
+            "candidates": candidates,
+            "query_key": query_key
+        })
+    return resolutions
+
+
+_alias_index = None
+_alias_index_lock = threading.Lock()
+
+
+def get_alias_index():
+    # Process-wide alias index from config.ALIAS_TABLE_PATH, or None when not configured
+    global _alias_index
+    if not config.ALIAS_TABLE_PATH:
+        return None
+    with _alias_index_lock:
+        if _alias_index is None or _alias_index.path != config.ALIAS_TABLE_PATH:
+            _alias_index = AliasIndex(config.ALIAS_TABLE_PATH)
+        return _alias_index